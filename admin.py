@@ -1,7 +1,13 @@
-from flask import Blueprint, render_template, redirect, url_for, flash
+import json
+from flask import Blueprint, render_template, redirect, url_for, flash, jsonify, request, current_app, abort, Response, stream_with_context
+from sqlalchemy import func
 from flask_login import login_required, current_user
 from models import db, Herb, Disease, HerbDiseaseAssociation
-from forms import AddHerbForm, AddDiseaseForm, AddAssociationForm, BulkAddHerbForm, BulkAddDiseaseForm, BulkAddAssociationForm
+from model_registry import commit_kb_changes, get_kb_version, registry
+from forms import AddHerbForm, AddDiseaseForm, AddAssociationForm, BulkAddHerbForm, BulkAddDiseaseForm, BulkAddAssociationForm, ImportFileForm
+from importer import IMPORTERS, import_herbs, import_diseases, import_associations, open_text, read_rows
+from rollups import disease_series, herb_series, default_range
+from exporter import EXPORTS, FORMATS, export, export_filename, parse_export_filters
 
 admin = Blueprint('admin', __name__)
 
@@ -13,6 +19,51 @@ def admin_dashboard():
         return redirect(url_for('main.index'))
     return render_template('admin/dashboard.html')
 
+@admin.route('/admin/model_status')
+@login_required
+def model_status():
+    if not current_user.is_admin:
+        flash('您没有权限访问此页面。')
+        return redirect(url_for('main.index'))
+    return jsonify({'kb_version': get_kb_version(), 'models': registry.status()})
+
+@admin.route('/admin/analytics')
+@login_required
+def analytics():
+    if not current_user.is_admin:
+        flash('您没有权限访问此页面。')
+        return redirect(url_for('main.index'))
+    days = min(max(request.args.get('days', 90, type=int), 1), 730)
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ('day', 'week'):
+        granularity = 'day'
+    start, end = default_range(days)
+    
+    # 图表只读取按天汇总的表，不扫描诊断日志
+    top_diseases, disease_trend = disease_series(start, end, granularity)
+    top_herbs, herb_trend = herb_series(start, end, granularity)
+    
+    import plotly.graph_objs as go
+    import plotly.utils
+    
+    def trend_figure(series, title):
+        fig = go.Figure(data=[go.Scatter(x=sorted(counts), y=[counts[period] for period in sorted(counts)],
+                                         mode='lines+markers', name=name)
+                              for name, counts in series.items()])
+        fig.update_layout(title_text=title)
+        return fig
+    
+    unit = '周' if granularity == 'week' else '天'
+    charts = {
+        'disease_trend': trend_figure(disease_trend, f'常见疾病诊断次数（按{unit}）'),
+        'herb_ranking': go.Figure(data=[go.Bar(x=[name for name, _ in top_herbs], y=[total for _, total in top_herbs])],
+                                  layout={'title': {'text': f'近 {days} 天常用中药'}}),
+        'herb_trend': trend_figure(herb_trend, f'常用中药使用次数（按{unit}）'),
+    }
+    graphJSON = json.dumps(charts, cls=plotly.utils.PlotlyJSONEncoder)
+    return render_template('admin/analytics.html', graphJSON=graphJSON, days=days, granularity=granularity,
+                           top_diseases=top_diseases)
+
 @admin.route('/admin/add_herb', methods=['GET', 'POST'])
 @login_required
 def add_herb():
@@ -23,7 +74,7 @@ def add_herb():
     if form.validate_on_submit():
         herb = Herb(name=form.name.data)
         db.session.add(herb)
-        db.session.commit()
+        commit_kb_changes()
         flash('中药添加成功！')
         return redirect(url_for('admin.admin_dashboard'))
     return render_template('admin/add_herb.html', form=form)
@@ -38,7 +89,7 @@ def add_disease():
     if form.validate_on_submit():
         disease = Disease(name=form.name.data)
         db.session.add(disease)
-        db.session.commit()
+        commit_kb_changes()
         flash('疾病添加成功！')
         return redirect(url_for('admin.admin_dashboard'))
     return render_template('admin/add_disease.html', form=form)
@@ -53,10 +104,12 @@ def add_association():
     if form.validate_on_submit():
         herb = Herb.query.filter_by(name=form.herb.data).first()
         disease = Disease.query.filter_by(name=form.disease.data).first()
-        if herb and disease:
+        if herb and disease and _association_exists(herb.id, disease.id):
+            flash('关联已存在。')
+        elif herb and disease:
             association = HerbDiseaseAssociation(herb_id=herb.id, disease_id=disease.id)
             db.session.add(association)
-            db.session.commit()
+            commit_kb_changes()
             flash('关联添加成功！')
         else:
             flash('中药或疾病不存在，请先添加。')
@@ -66,20 +119,53 @@ def add_association():
 @admin.route('/manage_herbs')
 @login_required
 def manage_herbs():
-    herbs = Herb.query.all()
-    return render_template('admin/manage_herbs.html', herbs=herbs)
+    q = request.args.get('q', '').strip()
+    disease_count = db.session.query(func.count(HerbDiseaseAssociation.id)) \
+        .filter(HerbDiseaseAssociation.herb_id == Herb.id) \
+        .scalar_subquery()
+    query = db.session.query(Herb.id, Herb.name, disease_count.label('disease_count'))
+    if q:
+        query = query.filter(Herb.name.startswith(q, autoescape=True))
+    pagination = query.order_by(Herb.id).paginate(page=request.args.get('page', 1, type=int),
+                                                  per_page=current_app.config['ADMIN_PAGE_SIZE'],
+                                                  error_out=False)
+    return render_template('admin/manage_herbs.html', herbs=pagination.items, pagination=pagination, q=q)
 
 @admin.route('/manage_diseases')
 @login_required
 def manage_diseases():
-    diseases = Disease.query.all()
-    return render_template('admin/manage_diseases.html', diseases=diseases)
+    q = request.args.get('q', '').strip()
+    herb_count = db.session.query(func.count(HerbDiseaseAssociation.id)) \
+        .filter(HerbDiseaseAssociation.disease_id == Disease.id) \
+        .scalar_subquery()
+    query = db.session.query(Disease.id, Disease.name, herb_count.label('herb_count'))
+    if q:
+        query = query.filter(Disease.name.startswith(q, autoescape=True))
+    pagination = query.order_by(Disease.id).paginate(page=request.args.get('page', 1, type=int),
+                                                     per_page=current_app.config['ADMIN_PAGE_SIZE'],
+                                                     error_out=False)
+    return render_template('admin/manage_diseases.html', diseases=pagination.items, pagination=pagination, q=q)
 
 @admin.route('/manage_associations')
 @login_required
 def manage_associations():
-    associations = HerbDiseaseAssociation.query.all()
-    return render_template('admin/manage_associations.html', associations=associations)
+    herb = request.args.get('herb', '').strip()
+    disease = request.args.get('disease', '').strip()
+    # 关联查询中药和疾病名称，避免模板中逐行懒加载
+    query = db.session.query(HerbDiseaseAssociation.id,
+                             Herb.name.label('herb_name'),
+                             Disease.name.label('disease_name')) \
+        .join(Herb, HerbDiseaseAssociation.herb_id == Herb.id) \
+        .join(Disease, HerbDiseaseAssociation.disease_id == Disease.id)
+    if herb:
+        query = query.filter(Herb.name.startswith(herb, autoescape=True))
+    if disease:
+        query = query.filter(Disease.name.startswith(disease, autoescape=True))
+    pagination = query.order_by(HerbDiseaseAssociation.id).paginate(page=request.args.get('page', 1, type=int),
+                                                                    per_page=current_app.config['ADMIN_PAGE_SIZE'],
+                                                                    error_out=False)
+    return render_template('admin/manage_associations.html', associations=pagination.items,
+                           pagination=pagination, herb=herb, disease=disease)
 
 @admin.route('/edit_herb/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -88,7 +174,7 @@ def edit_herb(id):
     form = AddHerbForm(obj=herb)
     if form.validate_on_submit():
         herb.name = form.name.data
-        db.session.commit()
+        commit_kb_changes()
         flash('中药更新成功')
         return redirect(url_for('admin.manage_herbs'))
     return render_template('admin/edit_herb.html', form=form, herb=herb)
@@ -98,7 +184,7 @@ def edit_herb(id):
 def delete_herb(id):
     herb = Herb.query.get_or_404(id)
     db.session.delete(herb)
-    db.session.commit()
+    commit_kb_changes()
     flash('中药删除成功')
     return redirect(url_for('admin.manage_herbs'))
 
@@ -109,7 +195,7 @@ def edit_disease(id):
     form = AddDiseaseForm(obj=disease)
     if form.validate_on_submit():
         disease.name = form.name.data
-        db.session.commit()
+        commit_kb_changes()
         flash('疾病更新成功')
         return redirect(url_for('admin.manage_diseases'))
     return render_template('admin/edit_disease.html', form=form, disease=disease)
@@ -119,7 +205,7 @@ def edit_disease(id):
 def delete_diseases(id):
     disease = Disease.query.get_or_404(id)
     db.session.delete(disease)
-    db.session.commit()
+    commit_kb_changes()
     flash('疾病删除成功')
     return redirect(url_for('admin.manage_diseases'))
 
@@ -131,10 +217,12 @@ def edit_association(id):
     if form.validate_on_submit():
         herb = Herb.query.filter_by(name=form.herb.data).first()
         disease = Disease.query.filter_by(name=form.disease.data).first()
-        if herb and disease:
+        if herb and disease and _association_exists(herb.id, disease.id, exclude_id=association.id):
+            flash('关联已存在。')
+        elif herb and disease:
             association.herb = herb
             association.disease = disease
-            db.session.commit()
+            commit_kb_changes()
             flash('关联更新成功')
             return redirect(url_for('admin.manage_associations'))
         else:
@@ -149,10 +237,29 @@ def edit_association(id):
 def delete_association(id):
     association = HerbDiseaseAssociation.query.get_or_404(id)
     db.session.delete(association)
-    db.session.commit()
+    commit_kb_changes()
     flash('关联删除成功')
     return redirect(url_for('admin.manage_associations'))
 
+def _association_exists(herb_id, disease_id, exclude_id=None):
+    # 每对中药-疾病只能有一条关联（唯一约束），提交前先检查
+    query = HerbDiseaseAssociation.query.filter_by(herb_id=herb_id, disease_id=disease_id)
+    if exclude_id is not None:
+        query = query.filter(HerbDiseaseAssociation.id != exclude_id)
+    return db.session.query(query.exists()).scalar()
+
+def _text_rows(text, prefix=()):
+    for line_no, line in enumerate(text.split('\n'), start=1):
+        line = line.strip()
+        if line:
+            yield line_no, [*prefix, line]
+
+def _flash_import_errors(report, limit=10):
+    for line_no, message in report.errors[:limit]:
+        flash(f'第 {line_no} 行：{message}')
+    if len(report.errors) > limit:
+        flash(f'另有 {len(report.errors) - limit} 行导入失败。')
+
 @admin.route('/admin/bulk_add_herbs', methods=['GET', 'POST'])
 @login_required
 def bulk_add_herbs():
@@ -161,21 +268,12 @@ def bulk_add_herbs():
         return redirect(url_for('main.index'))
     form = BulkAddHerbForm()
     if form.validate_on_submit():
-        herbs = form.herbs.data.split('\n')
-        added_count = 0
-        skipped_count = 0
-        for herb_name in herbs:
-            herb_name = herb_name.strip()
-            if herb_name:
-                existing_herb = Herb.query.filter_by(name=herb_name).first()
-                if existing_herb:
-                    skipped_count += 1
-                else:
-                    herb = Herb(name=herb_name)
-                    db.session.add(herb)
-                    added_count += 1
-        db.session.commit()
-        flash(f'中药批量添加完成！成功添加 {added_count} 个，跳过 {skipped_count} 个已存在的中药。')
+        report = import_herbs(_text_rows(form.herbs.data))
+        if report.added:
+            # 版本号已随导入的分块提交，这里只安排后台重新训练
+            registry.schedule_retrain()
+        _flash_import_errors(report)
+        flash(f'中药批量添加完成！成功添加 {report.added} 个，跳过 {report.skipped} 个已存在的中药。')
         return redirect(url_for('admin.admin_dashboard'))
     return render_template('admin/bulk_add_herbs.html', form=form)
 
@@ -187,21 +285,12 @@ def bulk_add_diseases():
         return redirect(url_for('main.index'))
     form = BulkAddDiseaseForm()
     if form.validate_on_submit():
-        diseases = form.diseases.data.split('\n')
-        added_count = 0
-        skipped_count = 0
-        for disease_name in diseases:
-            disease_name = disease_name.strip()
-            if disease_name:
-                existing_disease = Disease.query.filter_by(name=disease_name).first()
-                if existing_disease:
-                    skipped_count += 1
-                else:
-                    disease = Disease(name=disease_name)
-                    db.session.add(disease)
-                    added_count += 1
-        db.session.commit()
-        flash(f'疾病批量添加完成！成功添加 {added_count} 个，跳过 {skipped_count} 个已存在的疾病。')
+        report = import_diseases(_text_rows(form.diseases.data))
+        if report.added:
+            # 版本号已随导入的分块提交，这里只安排后台重新训练
+            registry.schedule_retrain()
+        _flash_import_errors(report)
+        flash(f'疾病批量添加完成！成功添加 {report.added} 个，跳过 {report.skipped} 个已存在的疾病。')
         return redirect(url_for('admin.admin_dashboard'))
     return render_template('admin/bulk_add_diseases.html', form=form)
 
@@ -215,32 +304,62 @@ def bulk_add_association():
     
     form = BulkAddAssociationForm()
     if form.validate_on_submit():
-        herb = Herb.query.filter_by(name=form.herb.data).first()
-        if not herb:
+        herb_name = form.herb.data.strip()
+        if not Herb.query.filter_by(name=herb_name).first():
             flash('中药不存在，请先添加。')
             return redirect(url_for('admin.bulk_add_association'))
         
-        diseases = form.diseases.data.split('\n')
-        added_count = 0
-        skipped_count = 0
-        
-        for disease_name in diseases:
-            disease_name = disease_name.strip()
-            if disease_name:
-                disease = Disease.query.filter_by(name=disease_name).first()
-                if disease:
-                    existing_association = HerbDiseaseAssociation.query.filter_by(herb_id=herb.id, disease_id=disease.id).first()
-                    if not existing_association:
-                        association = HerbDiseaseAssociation(herb_id=herb.id, disease_id=disease.id)
-                        db.session.add(association)
-                        added_count += 1
-                    else:
-                        skipped_count += 1
-                else:
-                    flash(f'疾病 "{disease_name}" 不存在，请先添加。')
-        
-        db.session.commit()
-        flash(f'批量添加关联完成：成功添加 {added_count} 个，跳过 {skipped_count} 个已存在的关联。')
+        report = import_associations(_text_rows(form.diseases.data, prefix=(herb_name,)))
+        if report.added:
+            # 版本号已随导入的分块提交，这里只安排后台重新训练
+            registry.schedule_retrain()
+        _flash_import_errors(report)
+        flash(f'批量添加关联完成：成功添加 {report.added} 个，跳过 {report.skipped} 个已存在的关联。')
         return redirect(url_for('admin.admin_dashboard'))
     
-    return render_template('admin/bulk_add_association.html', form=form)
\ No newline at end of file
+    return render_template('admin/bulk_add_association.html', form=form)
+
+@admin.route('/admin/import/<kind>', methods=['GET', 'POST'])
+@login_required
+def import_file(kind):
+    if not current_user.is_admin:
+        flash('您没有权限访问此页面。')
+        return redirect(url_for('main.index'))
+    if kind not in IMPORTERS:
+        abort(404)
+    
+    form = ImportFileForm()
+    report = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        # 逐行流式读取上传文件，按分块去重和批量插入
+        rows = read_rows(open_text(upload.stream), upload.filename, form.has_header.data)
+        report = IMPORTERS[kind](rows)
+        if report.added:
+            # 版本号已随导入的分块提交，这里只安排后台重新训练
+            registry.schedule_retrain()
+        flash(f'导入完成：成功添加 {report.added} 条，跳过 {report.skipped} 条已存在的记录，{len(report.errors)} 行出错。')
+    return render_template('admin/import_file.html', form=form, kind=kind, report=report)
+
+@admin.route('/admin/export/<kind>')
+@login_required
+def export_data(kind):
+    if not current_user.is_admin:
+        flash('您没有权限访问此页面。')
+        return redirect(url_for('main.index'))
+    if kind not in EXPORTS:
+        abort(404)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({'error': f'format 只能是 {"、".join(FORMATS)}'}), 400
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    try:
+        filters = parse_export_filters(request.args.get('user'), request.args.get('start'), request.args.get('end'))
+    except ValueError:
+        return jsonify({'error': '筛选条件格式不正确'}), 400
+    
+    # 生成器逐块输出，数据库游标在响应发送期间保持打开
+    mimetype = 'application/gzip' if compress else ('text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    response = Response(stream_with_context(export(kind, fmt, compress, **filters)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={export_filename(kind, fmt, compress)}'
+    return response
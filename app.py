@@ -8,13 +8,19 @@ from auth import auth as auth_blueprint
 from admin import admin as admin_blueprint
 from main import main as main_blueprint
 from diagnosis import diagnosis as diagnosis_blueprint
+from commands import register_commands
+from db_setup import configure_sqlite
+from metrics import init_metrics
+from result_cache import init_result_cache
+from log_writer import init_log_writer
 import logging
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
+configure_sqlite(app)
 db.init_app(app)
-migrate = Migrate(app, db) 
+migrate = Migrate(app, db, render_as_batch=True)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
@@ -24,6 +30,11 @@ app.register_blueprint(admin_blueprint)
 app.register_blueprint(diagnosis_blueprint)
 app.register_blueprint(main_blueprint)
 
+register_commands(app)
+init_metrics(app)
+init_result_cache(app)
+init_log_writer(app)
+
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -0,0 +1,175 @@
+import csv
+import json
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+from collections import deque
+from flask import current_app
+from importer import chunks, open_text, read_rows
+from herb_lexicon import HerbLexicon, lexicons, load_jieba
+from model_registry import registry, get_kb_version, get_kb_stamp, load_model
+from model_artifacts import artifact_path
+
+CHUNK_SIZE = 1000
+
+# 工作进程内的中药词典与模型，由 _init_worker 创建
+_worker = {}
+
+
+def input_format(path):
+    lower = path.lower()
+    if lower.endswith('.jsonl'):
+        return 'jsonl'
+    if lower.endswith(('.csv', '.tsv')):
+        return 'csv'
+    return 'txt'
+
+
+def read_prescriptions(path, fmt, column=0, field='prescription', has_header=False, on_error=None):
+    # 逐行流式读取，产生 (行号, 处方)；格式错误的行交给 on_error 报告后跳过，不中断整个任务
+    with open(path, 'rb') as f:
+        text = open_text(f)
+        if fmt == 'csv':
+            for line_no, row in read_rows(text, path, has_header):
+                if column < len(row) and row[column]:
+                    yield line_no, row[column]
+            return
+        for line_no, line in enumerate(text, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if fmt == 'jsonl':
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    item = None
+                if not isinstance(item, dict):
+                    if on_error is not None:
+                        on_error(line_no, '不是有效的JSON对象')
+                    continue
+                line = str(item.get(field) or '').strip()
+                if not line:
+                    continue
+            yield line_no, line
+
+
+def _init_worker(version, herbs, freqs, jieba_cache_dir, model_source, top):
+    jieba = load_jieba(jieba_cache_dir)
+    for name, freq in freqs.items():
+        jieba.add_word(name, freq)
+    _worker['lexicon'] = HerbLexicon(version, herbs)
+    if isinstance(model_source, tuple):
+        # 以只读内存映射加载主进程已检查过的模型文件，各进程共享页缓存
+        path, stamp, fallback_path = model_source
+        model = load_model(path, stamp)
+        if model is None:
+            # 模型文件在检查之后被清理或替换时改用主进程序列化的模型；
+            # 初始化函数出错会让进程池不断重启工作进程，这里不能抛出异常
+            with open(fallback_path, 'rb') as f:
+                model = pickle.load(f)
+    else:
+        model = model_source
+    _worker['model'] = model
+    _worker['top'] = top
+
+
+def _diagnose_chunk(prescriptions):
+    # 分词、特征构建和评分都在工作进程中完成，主进程只负责读写文件
+    lexicon = _worker['lexicon']
+    model = _worker['model']
+    top = _worker['top']
+    X = model.featurize([lexicon.match(prescription) for prescription in prescriptions])
+    results = [model.results(probabilities) for probabilities in model.predict_proba(X)]
+    return [result[:top] if top else result for result in results]
+
+
+def _model_artifact(model):
+    # 在创建进程池之前确认模型文件存在且属于当前知识库，可用时返回 (路径, 标识)
+    directory = current_app.config['MODEL_ARTIFACT_DIR']
+    stamp = get_kb_stamp(model.version) if directory else None
+    if stamp is None:
+        return None
+    path = artifact_path(directory, model.scorer.name, model.version)
+    if load_model(path, stamp) is None:
+        return None
+    return path, stamp
+
+
+def _write_fallback(model):
+    fd, path = tempfile.mkstemp(prefix='tcm-model-', suffix='.pkl')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _diagnosed_chunks(batches, workers, init_args):
+    if workers <= 1:
+        _init_worker(*init_args)
+        for batch in batches:
+            yield batch, _diagnose_chunk([prescription for _, prescription in batch])
+        return
+    # 使用spawn启动工作进程，避免fork继承数据库连接和后台线程
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, initializer=_init_worker, initargs=init_args) as pool:
+        # 最多同时排队 workers*2 个分块，保持顺序且内存占用有上限
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, pool.apply_async(_diagnose_chunk, ([prescription for _, prescription in batch],))))
+            if len(pending) >= workers * 2:
+                batch, result = pending.popleft()
+                yield batch, result.get()
+        while pending:
+            batch, result = pending.popleft()
+            yield batch, result.get()
+
+
+class ResultWriter:
+    def __init__(self, output, fmt):
+        self.output = output
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.writer(output)
+            self.writer.writerow(('line', 'prescription', 'results'))
+
+    def write(self, line_no, prescription, result):
+        if self.fmt == 'csv':
+            self.writer.writerow((line_no, prescription,
+                                  ';'.join(f"{item['name']}:{item['probability']:.4f}" for item in result)))
+        else:
+            self.output.write(json.dumps({'line': line_no, 'prescription': prescription, 'result': result},
+                                         ensure_ascii=False) + '\n')
+
+
+def run_batch(rows, output, output_format='jsonl', workers=1, chunk_size=CHUNK_SIZE, top=0, progress=None):
+    version = get_kb_version()
+    lexicon = lexicons.get_lexicon(version)
+    model = registry.get_model(version=version)
+    jieba_cache_dir = current_app.config['JIEBA_CACHE_DIR']
+    jieba = load_jieba(jieba_cache_dir)
+    herbs = [(herb_id, name) for name, herb_id in lexicon.index.items()]
+    freqs = {name: jieba.get_FREQ(name) for name in lexicon.index if jieba.get_FREQ(name)}
+    # 模型文件可用时只把路径传给工作进程，另把模型序列化到临时文件备用；否则把模型本身传过去
+    model_source = model
+    fallback_path = None
+    artifact = _model_artifact(model) if workers > 1 else None
+    if artifact is not None:
+        fallback_path = _write_fallback(model)
+        model_source = (*artifact, fallback_path)
+    init_args = (version, herbs, freqs, jieba_cache_dir, model_source, top)
+
+    writer = ResultWriter(output, output_format)
+    started = time.perf_counter()
+    total = 0
+    try:
+        for batch, results in _diagnosed_chunks(chunks(rows, chunk_size), workers, init_args):
+            for (line_no, prescription), result in zip(batch, results):
+                writer.write(line_no, prescription, result)
+            total += len(batch)
+            if progress is not None:
+                progress(total, time.perf_counter() - started)
+    finally:
+        if fallback_path is not None:
+            os.remove(fallback_path)
+    return total, time.perf_counter() - started
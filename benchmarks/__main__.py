@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='中医诊断系统性能基准测试')
+    parser.add_argument('--db', default='bench.db', help='基准测试使用的SQLite数据库文件')
+    parser.add_argument('--regenerate', action='store_true', help='重新生成合成数据集')
+    parser.add_argument('--herbs', type=int, default=2000)
+    parser.add_argument('--diseases', type=int, default=500)
+    parser.add_argument('--density', type=float, default=0.01, help='中药-疾病关联密度')
+    parser.add_argument('--logs', type=int, default=1000000, help='诊断日志条数')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--backend', default='random_forest', help='评分后端')
+    parser.add_argument('--requests', type=int, default=200, help='单条诊断请求次数')
+    parser.add_argument('--output', help='结果JSON文件路径')
+    return parser.parse_args()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def remove_database(path):
+    # WAL模式会留下 -wal/-shm 文件，与数据库文件一起删除
+    for name in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def main():
+    args = parse_args()
+    started_at = datetime.utcnow()
+    db_path = os.path.abspath(args.db)
+    # 诊断、批量诊断和导入都会写数据库，所有场景都在数据集的副本上运行，
+    # 原始数据集保持不变，每次运行的起点相同
+    run_path = db_path + '.run'
+    regenerate = args.regenerate or not os.path.exists(db_path)
+    # 先删除上次异常退出时留下的副本及其 -wal/-shm 文件，避免与新副本混用
+    remove_database(run_path)
+    if not regenerate:
+        shutil.copyfile(db_path, run_path)
+    # Config 在导入时读取环境变量，必须先设置再导入应用（冷启动子进程同样继承）
+    os.environ['DATABASE_URL'] = f'sqlite:///{run_path}'
+    os.environ['SCORING_BACKEND'] = args.backend
+    os.environ.setdefault('MODEL_RETRAIN_DELAY', '0')
+    # 本次运行的模型文件和词典缓存放在临时目录中，不受之前运行留下的缓存影响
+    cache_dir = tempfile.mkdtemp(prefix='tcm-bench-')
+    from benchmarks.scenarios import cache_env
+    os.environ.update(cache_env(cache_dir))
+
+    from app import app
+    from models import db
+    from benchmarks import generator, scenarios
+
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    dataset = None
+    if regenerate:
+        print(f'生成合成数据集 -> {db_path}', file=sys.stderr)
+        started = time.perf_counter()
+        with app.app_context():
+            dataset = generator.generate(herbs=args.herbs, diseases=args.diseases, density=args.density,
+                                         logs=args.logs, users=args.users, seed=args.seed)
+            db.engine.dispose()
+        dataset['generate_seconds'] = time.perf_counter() - started
+        # 生成结果保存为原始数据集，本次运行继续使用副本
+        remove_database(db_path)
+        shutil.copyfile(run_path, db_path)
+
+    results = {}
+    username = scenarios.heaviest_user(app)
+    print('冷启动', file=sys.stderr)
+    results['cold_start'] = {'cold': scenarios.cold_start(app, username, warm=False),
+                             'warm': scenarios.cold_start(app, username, warm=True)}
+
+    user_client = app.test_client()
+    scenarios.login(user_client, username)
+    print('单条诊断延迟', file=sys.stderr)
+    results['diagnose_latency'] = scenarios.diagnose_latency(app, user_client, requests=args.requests)
+    print('批量诊断吞吐量', file=sys.stderr)
+    results['batch_throughput'] = scenarios.batch_throughput(app, user_client)
+    print('统计页面与诊断历史', file=sys.stderr)
+    results['statistics_page'] = scenarios.page_times(user_client, '/statistics')
+    results['history_page'] = scenarios.page_times(user_client, '/history')
+
+    admin_client = app.test_client()
+    scenarios.login(admin_client, 'bench0')
+    print('文件批量导入', file=sys.stderr)
+    results['bulk_import'] = scenarios.bulk_import_rate(app, admin_client)
+    with app.app_context():
+        db.engine.dispose()
+    remove_database(run_path)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    report = {
+        'meta': {'started_at': started_at.isoformat(),
+                 'git_revision': git_revision(),
+                 'python': platform.python_version(),
+                 'platform': platform.platform(),
+                 'database': db_path,
+                 'backend': args.backend,
+                 'seed': args.seed,
+                 'dataset': dataset},
+        'scenarios': results,
+    }
+    output = args.output or os.path.join('bench_results', started_at.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
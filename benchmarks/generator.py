@@ -0,0 +1,115 @@
+import random
+from datetime import datetime, timedelta
+import numpy as np
+from scipy import sparse
+from werkzeug.security import generate_password_hash
+from models import db, User, Herb, Disease, HerbDiseaseAssociation, DiagnosisLog, DiagnosisResult
+from herb_lexicon import herb_key
+from rollups import rebuild_rollups
+from similarity import rebuild_similarity_index
+from model_registry import bump_kb_version
+from scoring import SparseIncidenceScorer
+
+HERB_CHARS = '甘草人参黄芪当归白术茯苓川芎芍药地黄柴胡半夏陈皮桂枝麻黄杏仁石膏知母连翘金银花薄荷荆芥防风羌活独活秦艽牛膝杜仲续断桑寄生枸杞山药泽泻丹皮附子干姜细辛五味子'
+DISEASE_CHARS = '风寒热湿燥暑虚实气血阴阳肝心脾肺肾胃胆肠经络表里痹痿咳喘眩悸痛胀'
+BENCH_PASSWORD = 'benchmark'
+INSERT_CHUNK = 10000
+MAX_RESULTS = 10
+
+
+def _unique_names(rng, chars, count, min_len, max_len, suffix=''):
+    names = set()
+    while len(names) < count:
+        length = rng.randint(min_len, max_len)
+        names.add(''.join(rng.choice(chars) for _ in range(length)) + suffix)
+    return sorted(names)
+
+
+def _insert(table, rows):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(table.insert(), rows[start:start + INSERT_CHUNK])
+
+
+def generate(herbs=2000, diseases=500, density=0.01, logs=1000000, users=100, days=365, seed=42):
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+
+    db.drop_all()
+    db.create_all()
+
+    # 用户：bench0 为管理员，其余为普通用户
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    _insert(User.__table__, [{'id': i + 1, 'username': f'bench{i}', 'email': f'bench{i}@example.com',
+                              'password_hash': password_hash, 'is_admin': i == 0}
+                             for i in range(users)])
+
+    herb_names = _unique_names(rng, HERB_CHARS, herbs, 2, 4)
+    disease_names = _unique_names(rng, DISEASE_CHARS, diseases, 2, 3, suffix='证')
+    _insert(Herb.__table__, [{'id': i + 1, 'name': name} for i, name in enumerate(herb_names)])
+    _insert(Disease.__table__, [{'id': i + 1, 'name': name} for i, name in enumerate(disease_names)])
+
+    # 每味中药按给定密度随机关联疾病，至少关联一个
+    pairs = []
+    for herb_index in range(herbs):
+        count = max(1, np_rng.binomial(diseases, density))
+        for disease_index in rng.sample(range(diseases), min(count, diseases)):
+            pairs.append((herb_index, disease_index))
+    _insert(HerbDiseaseAssociation.__table__, [{'herb_id': h + 1, 'disease_id': d + 1} for h, d in pairs])
+    bump_kb_version()
+    db.session.commit()
+
+    incidence = sparse.csr_matrix((np.ones(len(pairs)), ([h for h, _ in pairs], [d for _, d in pairs])),
+                                  shape=(herbs, diseases))
+    scorer = SparseIncidenceScorer().fit(incidence)
+
+    # 常用方剂被反复开具：一部分处方来自固定的经典方，其余按热门程度（Zipf分布）抽取中药
+    popularity = 1.0 / np.arange(1, herbs + 1) ** 1.1
+    popularity /= popularity.sum()
+    formulas = [sorted(np_rng.choice(herbs, size=rng.randint(4, 12), replace=False, p=popularity).tolist())
+                for _ in range(200)]
+    # 用户的诊断次数同样是长尾分布
+    user_weights = 1.0 / np.arange(1, users + 1)
+    user_weights /= user_weights.sum()
+    start_time = datetime.utcnow() - timedelta(days=days)
+
+    log_id = 0
+    for chunk_start in range(0, logs, INSERT_CHUNK):
+        chunk_size = min(INSERT_CHUNK, logs - chunk_start)
+        prescriptions = []
+        for _ in range(chunk_size):
+            if rng.random() < 0.3:
+                prescriptions.append(rng.choice(formulas))
+            else:
+                size = rng.randint(3, 12)
+                prescriptions.append(sorted(np_rng.choice(herbs, size=size, replace=False, p=popularity).tolist()))
+        user_ids = np_rng.choice(users, size=chunk_size, p=user_weights) + 1
+        offsets = np.sort(np_rng.uniform(0, days * 86400, size=chunk_size))
+
+        rows = [i for i, herb_indices in enumerate(prescriptions) for _ in herb_indices]
+        columns = [h for herb_indices in prescriptions for h in herb_indices]
+        X = sparse.csr_matrix((np.ones(len(rows)), (rows, columns)), shape=(chunk_size, herbs))
+        probabilities = scorer.predict_proba(X)
+
+        log_rows = []
+        result_rows = []
+        for i, herb_indices in enumerate(prescriptions):
+            log_id += 1
+            log_rows.append({'id': log_id,
+                             'user_id': int(user_ids[i]),
+                             'prescription': '，'.join(herb_names[h] for h in herb_indices),
+                             'herb_ids': herb_key(h + 1 for h in herb_indices),
+                             'timestamp': start_time + timedelta(seconds=float(offsets[i]))})
+            top = np.argsort(-probabilities[i])[:MAX_RESULTS]
+            for rank, disease_index in enumerate(top, start=1):
+                if probabilities[i, disease_index] <= 0:
+                    break
+                result_rows.append({'log_id': log_id, 'disease_id': int(disease_index) + 1,
+                                    'probability': float(probabilities[i, disease_index]), 'rank': rank})
+        _insert(DiagnosisLog.__table__, log_rows)
+        _insert(DiagnosisResult.__table__, result_rows)
+        db.session.commit()
+    rebuild_rollups()
+    rebuild_similarity_index()
+
+    return {'herbs': herbs, 'diseases': diseases, 'associations': len(pairs), 'logs': logs,
+            'users': users, 'days': days, 'seed': seed}
@@ -0,0 +1,156 @@
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from sqlalchemy import func
+from models import db, Herb, Disease, HerbDiseaseAssociation, DiagnosisLog, User
+from benchmarks.generator import BENCH_PASSWORD
+
+# 在新进程中测量导入应用、预热和首个诊断请求的耗时
+COLD_START_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+warm_up_seconds = None
+if sys.argv[1] == 'warm':
+    from warmup import warm_up
+    warm_up_seconds = warm_up(app)
+app.config['WTF_CSRF_ENABLED'] = False
+from benchmarks import scenarios
+client = app.test_client()
+scenarios.login(client, sys.argv[2])
+first = time.perf_counter()
+client.post('/diagnose', data={'prescription': sys.argv[3]})
+done = time.perf_counter()
+print(json.dumps({'import_seconds': imported - started, 'warm_up_seconds': warm_up_seconds,
+                  'first_request_ms': (done - first) * 1000}))
+'''
+
+
+def _summary(durations):
+    durations = sorted(durations)
+
+    def percentile(p):
+        return durations[min(len(durations) - 1, int(round(p / 100 * (len(durations) - 1))))]
+
+    return {'count': len(durations),
+            'mean_ms': statistics.mean(durations) * 1000,
+            'p50_ms': percentile(50) * 1000,
+            'p95_ms': percentile(95) * 1000,
+            'p99_ms': percentile(99) * 1000,
+            'max_ms': durations[-1] * 1000}
+
+
+def _timed(func_, *args, **kwargs):
+    started = time.perf_counter()
+    response = func_(*args, **kwargs)
+    elapsed = time.perf_counter() - started
+    if response.status_code >= 400:
+        raise RuntimeError(f'{response.request.path} 返回 {response.status_code}')
+    return elapsed, response
+
+
+def login(client, username):
+    response = client.post('/login', data={'username': username, 'password': BENCH_PASSWORD})
+    # 登录失败同样会重定向，但是回到登录页
+    if response.status_code != 302 or response.headers['Location'].endswith('/login'):
+        raise RuntimeError(f'用户 {username} 登录失败')
+
+
+def random_prescriptions(app, count, seed):
+    rng = random.Random(seed)
+    with app.app_context():
+        herb_names = [name for name, in db.session.query(Herb.name).order_by(Herb.id)]
+    # 模拟手工输入：顺序打乱，分隔符和空白不统一
+    separators = ['，', ',', ' ', '、']
+    return [rng.choice(separators).join(rng.sample(herb_names, rng.randint(3, 12)))
+            for _ in range(count)]
+
+
+def heaviest_user(app):
+    with app.app_context():
+        user_id = db.session.query(DiagnosisLog.user_id) \
+            .group_by(DiagnosisLog.user_id) \
+            .order_by(func.count(DiagnosisLog.id).desc()) \
+            .limit(1).scalar()
+        return User.query.get(user_id).username
+
+
+def diagnose_latency(app, client, requests=200, seed=1):
+    prescriptions = random_prescriptions(app, requests + 1, seed)
+    # 第一次请求包含模型训练，单独记录
+    first, _ = _timed(client.post, '/diagnose', data={'prescription': prescriptions[0]})
+    durations = [_timed(client.post, '/diagnose', data={'prescription': p})[0] for p in prescriptions[1:]]
+    return {'first_request_ms': first * 1000, **_summary(durations)}
+
+
+def batch_throughput(app, client, batch_sizes=(10, 100, 500), batches=5, seed=2):
+    results = {}
+    for batch_size in batch_sizes:
+        prescriptions = random_prescriptions(app, batch_size * batches, seed)
+        durations = []
+        for i in range(batches):
+            batch = prescriptions[i * batch_size:(i + 1) * batch_size]
+            durations.append(_timed(client.post, '/diagnose/batch', json={'prescriptions': batch})[0])
+        results[str(batch_size)] = {'prescriptions_per_second': batch_size * batches / sum(durations),
+                                    **_summary(durations)}
+    return results
+
+
+def page_times(client, path, repeat=10):
+    return _summary([_timed(client.get, path)[0] for _ in range(repeat)])
+
+
+def _row_counts(app):
+    with app.app_context():
+        return {'herbs': db.session.query(func.count(Herb.id)).scalar(),
+                'associations': db.session.query(func.count(HerbDiseaseAssociation.id)).scalar()}
+
+
+def bulk_import_rate(app, client, herbs=5000, associations=20000, seed=3):
+    rng = random.Random(seed)
+    with app.app_context():
+        disease_names = [name for name, in db.session.query(Disease.name).order_by(Disease.id)]
+    herb_names = [f'导入药{i:06d}' for i in range(herbs)]
+    herb_file = '\n'.join(herb_names).encode('utf-8')
+    association_file = '\n'.join(f'{rng.choice(herb_names)},{rng.choice(disease_names)}'
+                                 for _ in range(associations)).encode('utf-8')
+
+    # 重复的行会被导入跳过，同时记录实际新增的行数
+    before = _row_counts(app)
+    herb_seconds, _ = _timed(client.post, '/admin/import/herbs',
+                             data={'file': (io.BytesIO(herb_file), 'herbs.csv')},
+                             content_type='multipart/form-data')
+    association_seconds, _ = _timed(client.post, '/admin/import/associations',
+                                    data={'file': (io.BytesIO(association_file), 'associations.csv')},
+                                    content_type='multipart/form-data')
+    after = _row_counts(app)
+    return {'herbs': {'rows': herbs, 'added': after['herbs'] - before['herbs'], 'seconds': herb_seconds,
+                      'rows_per_second': herbs / herb_seconds},
+            'associations': {'rows': associations, 'added': after['associations'] - before['associations'],
+                             'seconds': association_seconds,
+                             'rows_per_second': associations / association_seconds}}
+
+
+def cache_env(directory):
+    # 模型文件、jieba与中药词典缓存都放在给定目录下，不复用之前运行留下的文件
+    return {'MODEL_ARTIFACT_DIR': os.path.join(directory, 'models'),
+            'JIEBA_CACHE_DIR': directory,
+            'HERB_DICT_CACHE': os.path.join(directory, 'herb_dict.json'),
+            'RESULT_CACHE_SHARED_PATH': ''}
+
+
+def cold_start(app, username, warm, seed=4):
+    prescription = random_prescriptions(app, 1, seed)[0]
+    # 每次都在全新的临时缓存目录中启动，才是真正的冷启动
+    with tempfile.TemporaryDirectory(prefix='tcm-cold-start-') as directory:
+        output = subprocess.check_output([sys.executable, '-c', COLD_START_SCRIPT,
+                                          'warm' if warm else 'cold', username, prescription],
+                                         env={**os.environ, **cache_env(directory)})
+    return json.loads(output.decode().strip().splitlines()[-1])
@@ -0,0 +1,110 @@
+import os
+import click
+from flask import current_app
+from importer import IMPORTERS, open_text, read_rows
+from warmup import warm_up
+from rollups import rebuild_rollups
+from similarity import rebuild_similarity_index
+from exporter import EXPORTS, FORMATS, export, parse_export_filters
+from batch_diagnosis import CHUNK_SIZE, input_format, read_prescriptions, run_batch
+
+
+def _run_import(kind, path, header):
+    with open(path, 'rb') as f:
+        # 知识库版本号随每个分块的提交一起递增
+        report = IMPORTERS[kind](read_rows(open_text(f), path, header))
+    for line_no, message in report.errors:
+        click.echo(f'第 {line_no} 行：{message}', err=True)
+    click.echo(f'成功添加 {report.added} 条，跳过 {report.skipped} 条已存在的记录，{len(report.errors)} 行出错。')
+
+
+def register_commands(app):
+    @app.cli.command('import-herbs')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--header', is_flag=True, help='首行为表头，导入时跳过。')
+    def import_herbs_command(path, header):
+        """从CSV/TSV文件流式导入中药（读取第一列）。"""
+        _run_import('herbs', path, header)
+
+    @app.cli.command('import-diseases')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--header', is_flag=True, help='首行为表头，导入时跳过。')
+    def import_diseases_command(path, header):
+        """从CSV/TSV文件流式导入疾病（读取第一列）。"""
+        _run_import('diseases', path, header)
+
+    @app.cli.command('import-associations')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--header', is_flag=True, help='首行为表头，导入时跳过。')
+    def import_associations_command(path, header):
+        """从CSV/TSV文件流式导入中药-疾病关联（每行：中药,疾病）。"""
+        _run_import('associations', path, header)
+
+    @app.cli.command('warm-up')
+    def warm_up_command():
+        """生成jieba与中药词典缓存并训练模型，可在部署时预先执行。"""
+        elapsed = warm_up(current_app._get_current_object())
+        click.echo(f'预热完成，耗时 {elapsed:.2f} 秒')
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """回填旧日志的中药id，并根据诊断日志重建按天汇总的统计表（应在停止服务时运行）。"""
+        stats = rebuild_rollups()
+        click.echo(f'回填 {stats["backfilled_logs"]} 条日志的中药id，'
+                   f'重建疾病汇总 {stats["disease_rows"]} 行、中药汇总 {stats["herb_rows"]} 行。')
+
+    @app.cli.command('rebuild-similar-index')
+    def rebuild_similar_index_command():
+        """根据诊断日志重建相似处方索引（修改 SIMILAR_NUM_PERM/SIMILAR_BANDS 后需执行，应在停止服务时运行）。"""
+        stats = rebuild_similarity_index()
+        click.echo(f'回填 {stats["backfilled_logs"]} 条日志的中药id，为 {stats["indexed_logs"]} 条日志重建相似处方索引。')
+
+    @app.cli.command('export')
+    @click.argument('kind', type=click.Choice(list(EXPORTS)))
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS), default='csv', help='输出格式。')
+    @click.option('--output', '-o', type=click.File('wb'), default='-', help='输出文件，默认输出到标准输出。')
+    @click.option('--gzip', 'compress', is_flag=True, help='使用gzip压缩输出。')
+    @click.option('--user', help='只导出该用户名的诊断日志。')
+    @click.option('--start', help='诊断日志起始日期（YYYY-MM-DD）。')
+    @click.option('--end', help='诊断日志结束日期（YYYY-MM-DD，包含当天）。')
+    def export_command(kind, fmt, output, compress, user, start, end):
+        """流式导出诊断日志（logs）或知识库（herbs、diseases、associations）。"""
+        try:
+            filters = parse_export_filters(user, start, end)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        for chunk in export(kind, fmt, compress, **filters):
+            output.write(chunk)
+
+    @app.cli.command('diagnose-batch')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-', help='输出文件，默认输出到标准输出。')
+    @click.option('--input-format', 'input_format_name', type=click.Choice(['txt', 'csv', 'jsonl']), help='输入格式，默认按扩展名判断。')
+    @click.option('--output-format', type=click.Choice(['jsonl', 'csv']), default='jsonl', help='输出格式。')
+    @click.option('--column', type=int, default=0, help='CSV/TSV中处方所在列的序号（从0开始）。')
+    @click.option('--field', default='prescription', help='JSONL中处方所在的字段。')
+    @click.option('--header', is_flag=True, help='CSV/TSV首行为表头，读取时跳过。')
+    @click.option('--workers', type=int, default=os.cpu_count() or 1, help='分词与评分的进程数。')
+    @click.option('--chunk-size', type=int, default=CHUNK_SIZE, help='每个分块的处方数。')
+    @click.option('--top', type=int, default=0, help='每个处方只输出概率最高的前N个疾病，0表示全部输出。')
+    def diagnose_batch_command(path, output, input_format_name, output_format, column, field, header,
+                               workers, chunk_size, top):
+        """离线批量诊断：流式读取处方文件（每行一个处方，或CSV/JSONL），多进程分词并按块评分，结果流式写出。"""
+        skipped = [0]
+
+        def report_error(line_no, message):
+            skipped[0] += 1
+            click.echo(f'第 {line_no} 行：{message}，已跳过', err=True)
+
+        rows = read_prescriptions(path, input_format_name or input_format(path), column, field, header, report_error)
+        last_report = [0.0]
+
+        def progress(total, elapsed):
+            # 每隔两秒在标准错误输出报告进度
+            if elapsed - last_report[0] >= 2:
+                last_report[0] = elapsed
+                click.echo(f'已处理 {total} 条，{total / elapsed:.0f} 条/秒', err=True)
+
+        total, elapsed = run_batch(rows, output, output_format, workers, chunk_size, top, progress)
+        click.echo(f'完成：共 {total} 条处方，跳过 {skipped[0]} 行格式错误，'
+                   f'耗时 {elapsed:.1f} 秒（{total / max(elapsed, 1e-9):.0f} 条/秒）', err=True)
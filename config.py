@@ -3,4 +3,63 @@ import os
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///tcm.db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # 数据库连接池：取出连接前先检测是否可用
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True}
+    if not SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        # PostgreSQL/MySQL 连接池大小与回收时间
+        SQLALCHEMY_ENGINE_OPTIONS.update(
+            pool_size=int(os.environ.get('DB_POOL_SIZE') or 10),
+            max_overflow=int(os.environ.get('DB_MAX_OVERFLOW') or 20),
+            pool_recycle=int(os.environ.get('DB_POOL_RECYCLE') or 1800),
+            pool_timeout=int(os.environ.get('DB_POOL_TIMEOUT') or 30),
+        )
+    # SQLite 连接建立时执行的 PRAGMA：WAL 模式允许读写并发，busy_timeout 避免立即报 database is locked
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL',
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE') or -65536),
+        'temp_store': 'MEMORY',
+    }
+    # 诊断评分后端：random_forest（随机森林）或 sparse（稀疏关联矩阵）
+    SCORING_BACKEND = os.environ.get('SCORING_BACKEND') or 'random_forest'
+    # /diagnose/batch 单次请求允许的最大处方数
+    DIAGNOSE_BATCH_LIMIT = int(os.environ.get('DIAGNOSE_BATCH_LIMIT') or 1000)
+    # 知识库修改后延迟多少秒再后台重新训练，期间的多次修改合并为一次训练
+    MODEL_RETRAIN_DELAY = float(os.environ.get('MODEL_RETRAIN_DELAY') or 2)
+    # 训练好的模型按知识库版本保存的目录，工作进程以只读内存映射方式加载（设为空字符串则不保存）
+    MODEL_ARTIFACT_DIR = os.environ.get('MODEL_ARTIFACT_DIR', os.path.join('cache', 'models'))
+    # 诊断历史每页加载的记录数
+    HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE') or 50)
+    # 管理后台列表每页显示的记录数
+    ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE') or 50)
+    # /metrics：多进程部署时各进程把指标快照写入 METRICS_DIR 后汇总输出（未设置则只输出当前进程）；
+    # 仅管理员可访问，或由抓取程序携带 Authorization: Bearer <METRICS_TOKEN>
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # 性能剖析：按比例抽样请求做 cProfile，耗时超过阈值（秒）的请求写入 PROFILE_DIR，0 表示关闭
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE') or 0)
+    PROFILE_SLOW_THRESHOLD = float(os.environ.get('PROFILE_SLOW_THRESHOLD') or 1)
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or 'profiles'
+    # jieba前缀词典缓存目录与中药名词频缓存文件（可在部署时用 flask warm-up 预先生成）
+    JIEBA_CACHE_DIR = os.environ.get('JIEBA_CACHE_DIR') or 'cache'
+    HERB_DICT_CACHE = os.environ.get('HERB_DICT_CACHE') or os.path.join('cache', 'herb_dict.json')
+    # 诊断结果缓存：进程内LRU的容量（0表示关闭）与有效期（秒），可选的多进程共享SQLite缓存文件
+    RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE') or 10000)
+    RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL') or 3600)
+    RESULT_CACHE_SHARED_PATH = os.environ.get('RESULT_CACHE_SHARED_PATH')
+    # 相似处方检索：MinHash签名长度与LSH分段数（签名长度须为分段数的整数倍，修改后需执行
+    # flask rebuild-similar-index），默认返回条数
+    SIMILAR_NUM_PERM = int(os.environ.get('SIMILAR_NUM_PERM') or 64)
+    SIMILAR_BANDS = int(os.environ.get('SIMILAR_BANDS') or 16)
+    SIMILAR_TOP_K = int(os.environ.get('SIMILAR_TOP_K') or 10)
+    # 每次检索最多比较的候选日志数（最近的优先）
+    SIMILAR_MAX_CANDIDATES = int(os.environ.get('SIMILAR_MAX_CANDIDATES') or 500)
+    # 诊断日志异步批量写入：每 LOG_WRITER_BATCH_SIZE 条或每 LOG_WRITER_FLUSH_MS 毫秒写入一次，
+    # 队列满时请求线程最多等待 LOG_WRITER_PUT_TIMEOUT 秒，之后改为同步写入
+    LOG_WRITER_ASYNC = os.environ.get('LOG_WRITER_ASYNC', '').lower() in ('1', 'true', 'yes')
+    LOG_WRITER_BATCH_SIZE = int(os.environ.get('LOG_WRITER_BATCH_SIZE') or 200)
+    LOG_WRITER_FLUSH_MS = int(os.environ.get('LOG_WRITER_FLUSH_MS') or 200)
+    LOG_WRITER_QUEUE_SIZE = int(os.environ.get('LOG_WRITER_QUEUE_SIZE') or 10000)
+    LOG_WRITER_PUT_TIMEOUT = float(os.environ.get('LOG_WRITER_PUT_TIMEOUT') or 0.5)
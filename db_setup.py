@@ -0,0 +1,16 @@
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def configure_sqlite(app):
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+
+    @event.listens_for(Engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
@@ -1,98 +1,145 @@
-import plotly.graph_objs as go
-import plotly.utils
 import json
-from flask import Blueprint, render_template, request, jsonify
+from datetime import datetime, timedelta
+from flask import Blueprint, render_template, request, jsonify, current_app, flash
 from flask_login import login_required, current_user
-from models import db, Herb, Disease, HerbDiseaseAssociation, DiagnosisLog
-from sklearn.multioutput import MultiOutputClassifier
-from sklearn.ensemble import RandomForestClassifier
-import numpy as np
-import jieba
+from sqlalchemy import func, or_, and_
+from sqlalchemy.orm import selectinload
+from models import db, Disease, DiagnosisLog, DiagnosisResult
+from model_registry import registry, get_kb_version
+from herb_lexicon import lexicons, herb_key
+from metrics import timed_phase
+from result_cache import result_cache, cache_key
+from log_writer import log_writer, build_log_records
+from similarity import find_similar
+from herb_suggest import herb_suggestions
 
 diagnosis = Blueprint('diagnosis', __name__)
 
+def score_prescriptions(prescriptions):
+    version = get_kb_version()
+    
+    # 使用内存中的中药词典进行分词和匹配
+    with timed_phase('segment'):
+        lexicon = lexicons.get_lexicon(version)
+        herb_id_lists = [lexicon.match(prescription) for prescription in prescriptions]
+    
+    # 使用已训练的模型预测，知识库版本变化时才重新训练
+    with timed_phase('train'):
+        model = registry.get_model(version=version)
+    
+    # 相同中药组合的结果直接从缓存读取，只对未命中的处方做预测
+    results = [None] * len(prescriptions)
+    keys = [cache_key(model, herb_ids) for herb_ids in herb_id_lists]
+    if result_cache.enabled:
+        results = [result_cache.get(key) if key is not None else None for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        with timed_phase('feature_build'):
+            herb_features = model.featurize([herb_id_lists[i] for i in missing])
+        with timed_phase('predict'):
+            predictions = model.predict_proba(herb_features)
+            for i, row in zip(missing, predictions):
+                results[i] = model.results(row)
+                if keys[i] is not None:
+                    result_cache.set(keys[i], results[i])
+    return model, herb_id_lists, results
+
+def save_diagnosis_logs(user_id, prescriptions, herb_id_lists, results, model):
+    # 同步写入或交给后台线程批量写入，由 LOG_WRITER_ASYNC 决定
+    with timed_phase('persist'):
+        log_writer.submit(build_log_records(user_id, prescriptions, herb_id_lists, results, model))
+
 @diagnosis.route('/diagnose', methods=['POST'])
 @login_required
 def diagnose():
     prescription = request.form['prescription']
-    
-    # 使用jieba进行分词
-    words = jieba.cut(prescription)
-    herbs = [word for word in words if Herb.query.filter_by(name=word).first()]
-    
-    # 获取所有中药和疾病
-    all_herbs = Herb.query.all()
-    all_diseases = Disease.query.all()
-    
-    # 创建特征矩阵
-    herb_features = np.zeros((len(all_herbs),))
-    for herb in herbs:
-        herb_obj = Herb.query.filter_by(name=herb).first()
-        if herb_obj:
-            herb_index = all_herbs.index(herb_obj)
-            herb_features[herb_index] = 1
-    
-    # 准备训练数据
-    X = []
-    y = []
-    for herb in all_herbs:
-        associations = HerbDiseaseAssociation.query.filter_by(herb_id=herb.id).all()
-        disease_vector = np.zeros((len(all_diseases),))
-        for association in associations:
-            disease = Disease.query.get(association.disease_id)
-            disease_index = all_diseases.index(disease)
-            disease_vector[disease_index] = 1
-        X.append([1 if h == herb else 0 for h in all_herbs])
-        y.append(disease_vector)
-    
-    X = np.array(X)
-    y = np.array(y)
-    
-    # 训练多标签分类器
-    clf = MultiOutputClassifier(RandomForestClassifier(n_estimators=100))
-    clf.fit(X, y)
-    
-    # 预测
-    predictions = clf.predict_proba([herb_features])[0]
-    
-    # 获取结果
-    result = []
-    for i, prob in enumerate(predictions):
-        if prob[1] > 0:  # 只考虑正类的概率
-            disease_name = all_diseases[i].name
-            result.append({'name': disease_name, 'probability': float(prob[1])})
-    
-    result.sort(key=lambda x: x['probability'], reverse=True)
+    model, herb_id_lists, results = score_prescriptions([prescription])
+    result = results[0]
     
     # 记录诊断日志
-    log = DiagnosisLog(user_id=current_user.id,
-                       prescription=prescription,
-                       diagnosis_result=str(result))
-    db.session.add(log)
-    db.session.commit()
+    save_diagnosis_logs(current_user.id, [prescription], herb_id_lists, results, model)
     
     return jsonify(result)
 
+@diagnosis.route('/diagnose/batch', methods=['POST'])
+@login_required
+def diagnose_batch():
+    data = request.get_json(silent=True) or {}
+    prescriptions = data.get('prescriptions')
+    if not isinstance(prescriptions, list) or not all(isinstance(p, str) and p.strip() for p in prescriptions):
+        return jsonify({'error': 'prescriptions 必须是非空字符串列表'}), 400
+    limit = current_app.config['DIAGNOSE_BATCH_LIMIT']
+    if len(prescriptions) > limit:
+        return jsonify({'error': f'每次最多提交 {limit} 个处方'}), 400
+    
+    model, herb_id_lists, results = score_prescriptions(prescriptions)
+    
+    # 批量写入所有诊断日志
+    if prescriptions:
+        save_diagnosis_logs(current_user.id, prescriptions, herb_id_lists, results, model)
+    
+    return jsonify([{'prescription': prescription, 'result': result}
+                    for prescription, result in zip(prescriptions, results)])
+
+@diagnosis.route('/herbs/suggest')
+@login_required
+def suggest_herbs():
+    prefix = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 20)
+    # 内存中的排序索引，知识库版本变化时重建
+    return jsonify(herb_suggestions.get_suggester().suggest(prefix, limit))
+
+@diagnosis.route('/similar')
+@login_required
+def similar_prescriptions():
+    prescription = request.args.get('prescription', '')
+    k = min(max(request.args.get('k', current_app.config['SIMILAR_TOP_K'], type=int), 1), 50)
+    with timed_phase('segment'):
+        herb_ids = lexicons.get_lexicon().match(prescription)
+    
+    # 诊断后紧接着查询时，排除刚刚写入的这条日志本身
+    exclude_log_id = None
+    if request.args.get('exclude_latest'):
+        latest = db.session.query(DiagnosisLog.id, DiagnosisLog.herb_ids) \
+            .filter(DiagnosisLog.user_id == current_user.id) \
+            .order_by(DiagnosisLog.timestamp.desc(), DiagnosisLog.id.desc()).first()
+        if latest is not None and latest.herb_ids == herb_key(herb_ids):
+            exclude_log_id = latest.id
+    
+    # 通过MinHash/LSH索引在当前用户的历史处方中找出中药组成相近的
+    with timed_phase('similar_search'):
+        matches = find_similar(current_user.id, herb_ids, k, exclude_log_id)
+    logs = {}
+    if matches:
+        logs = {log.id: log for log in DiagnosisLog.query
+                .options(selectinload(DiagnosisLog.results).joinedload(DiagnosisResult.disease))
+                .filter(DiagnosisLog.user_id == current_user.id,
+                        DiagnosisLog.id.in_([log_id for _, log_id in matches]))}
+    return jsonify([{'similarity': round(similarity, 4),
+                     'timestamp': logs[log_id].timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+                     'prescription': logs[log_id].prescription,
+                     'results': [{'name': result.disease_name, 'probability': result.probability}
+                                 for result in logs[log_id].results]}
+                    for similarity, log_id in matches if log_id in logs])
+
 @diagnosis.route('/statistics')
 @login_required
 def statistics():
-    # 获取用户的诊断历史
-    logs = DiagnosisLog.query.filter_by(user_id=current_user.id).all()
-    
-    # 统计每种疾病的诊断次数
-    disease_count = {}
-    for log in logs:
-        results = eval(log.diagnosis_result)
-        for result in results:
-            disease = result['name']
-            if disease in disease_count:
-                disease_count[disease] += 1
-            else:
-                disease_count[disease] = 1
+    # 在数据库中统计每种疾病的诊断次数
+    disease_count = db.session.query(Disease.name, func.count(DiagnosisResult.id)) \
+        .join(DiagnosisResult, DiagnosisResult.disease_id == Disease.id) \
+        .join(DiagnosisLog, DiagnosisLog.id == DiagnosisResult.log_id) \
+        .filter(DiagnosisLog.user_id == current_user.id) \
+        .group_by(Disease.id, Disease.name) \
+        .all()
+    
+    # plotly 只在统计页面使用，按需导入
+    import plotly.graph_objs as go
+    import plotly.utils
     
     # 创建饼图
-    labels = list(disease_count.keys())
-    values = list(disease_count.values())
+    labels = [name for name, _ in disease_count]
+    values = [count for _, count in disease_count]
     
     fig = go.Figure(data=[go.Pie(labels=labels, values=values)])
     fig.update_layout(title_text="疾病诊断统计")
@@ -101,8 +148,70 @@ def statistics():
     
     return render_template('statistics.html', graphJSON=graphJSON)
 
+def parse_history_args(args):
+    filters = {'start': None, 'end': None, 'disease': None, 'cursor': None}
+    if args.get('start'):
+        filters['start'] = datetime.strptime(args['start'], '%Y-%m-%d')
+    if args.get('end'):
+        # 结束日期包含当天
+        filters['end'] = datetime.strptime(args['end'], '%Y-%m-%d') + timedelta(days=1)
+    if args.get('disease'):
+        filters['disease'] = args['disease'].strip()
+    if args.get('cursor'):
+        timestamp, log_id = args['cursor'].rsplit('_', 1)
+        filters['cursor'] = (datetime.fromisoformat(timestamp), int(log_id))
+    return filters
+
+def query_history(user_id, start=None, end=None, disease=None, cursor=None):
+    query = DiagnosisLog.query.filter(DiagnosisLog.user_id == user_id)
+    if start:
+        query = query.filter(DiagnosisLog.timestamp >= start)
+    if end:
+        query = query.filter(DiagnosisLog.timestamp < end)
+    if disease:
+        query = query.filter(DiagnosisLog.results.any(
+            DiagnosisResult.disease.has(Disease.name == disease)))
+    if cursor:
+        # 键集分页：从上一页最后一条记录 (timestamp, id) 之后继续读取
+        timestamp, log_id = cursor
+        query = query.filter(or_(DiagnosisLog.timestamp < timestamp,
+                                 and_(DiagnosisLog.timestamp == timestamp, DiagnosisLog.id < log_id)))
+    page_size = current_app.config['HISTORY_PAGE_SIZE']
+    logs = query.options(selectinload(DiagnosisLog.results).joinedload(DiagnosisResult.disease)) \
+        .order_by(DiagnosisLog.timestamp.desc(), DiagnosisLog.id.desc()) \
+        .limit(page_size + 1).all()
+    next_cursor = None
+    if len(logs) > page_size:
+        logs = logs[:page_size]
+        next_cursor = f'{logs[-1].timestamp.isoformat()}_{logs[-1].id}'
+    return logs, next_cursor
+
 @diagnosis.route('/history')
 @login_required
 def diagnosis_history():
-    logs = DiagnosisLog.query.filter_by(user_id=current_user.id).order_by(DiagnosisLog.timestamp.desc()).all()
-    return render_template('diagnosis_history.html', logs=logs)
\ No newline at end of file
+    try:
+        filters = parse_history_args(request.args)
+    except ValueError:
+        flash('筛选条件格式不正确。')
+        filters = parse_history_args({})
+    logs, next_cursor = query_history(current_user.id, **filters)
+    return render_template('diagnosis_history.html', logs=logs, next_cursor=next_cursor,
+                           filters=request.args)
+
+@diagnosis.route('/history/data')
+@login_required
+def diagnosis_history_data():
+    try:
+        filters = parse_history_args(request.args)
+    except ValueError:
+        return jsonify({'error': '筛选条件格式不正确'}), 400
+    logs, next_cursor = query_history(current_user.id, **filters)
+    return jsonify({
+        'logs': [{'id': log.id,
+                  'timestamp': log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+                  'prescription': log.prescription,
+                  'results': [{'name': result.disease_name, 'probability': result.probability}
+                              for result in log.results]}
+                 for log in logs],
+        'next_cursor': next_cursor,
+    })
@@ -0,0 +1,137 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+from itertools import groupby
+from models import db, DELETED_DISEASE_NAME, User, Herb, Disease, HerbDiseaseAssociation, DiagnosisLog, DiagnosisResult
+
+CHUNK_SIZE = 1000
+FORMATS = ('csv', 'jsonl')
+
+
+def _stream(query):
+    # 服务端游标分块读取，内存占用与表的大小无关
+    return query.execution_options(stream_results=True).yield_per(CHUNK_SIZE)
+
+
+def export_herbs():
+    for herb_id, name in _stream(db.session.query(Herb.id, Herb.name).order_by(Herb.id)):
+        yield {'id': herb_id, 'name': name}
+
+
+def export_diseases():
+    for disease_id, name in _stream(db.session.query(Disease.id, Disease.name).order_by(Disease.id)):
+        yield {'id': disease_id, 'name': name}
+
+
+def export_associations():
+    query = db.session.query(HerbDiseaseAssociation.herb_id, Herb.name,
+                             HerbDiseaseAssociation.disease_id, Disease.name) \
+        .join(Herb, Herb.id == HerbDiseaseAssociation.herb_id) \
+        .join(Disease, Disease.id == HerbDiseaseAssociation.disease_id) \
+        .order_by(HerbDiseaseAssociation.id)
+    for herb_id, herb, disease_id, disease in _stream(query):
+        yield {'herb_id': herb_id, 'herb': herb, 'disease_id': disease_id, 'disease': disease}
+
+
+def export_logs(user_id=None, start=None, end=None):
+    query = db.session.query(DiagnosisLog.id, DiagnosisLog.user_id, DiagnosisLog.timestamp,
+                             DiagnosisLog.prescription, Disease.name, DiagnosisResult.probability) \
+        .outerjoin(DiagnosisResult, DiagnosisResult.log_id == DiagnosisLog.id) \
+        .outerjoin(Disease, Disease.id == DiagnosisResult.disease_id)
+    if user_id is not None:
+        query = query.filter(DiagnosisLog.user_id == user_id)
+    if start:
+        query = query.filter(DiagnosisLog.timestamp >= start)
+    if end:
+        query = query.filter(DiagnosisLog.timestamp < end)
+    # 每条诊断结果一行，按日志id排序后把同一条日志的结果合并
+    query = query.order_by(DiagnosisLog.id, DiagnosisResult.rank)
+    logs = groupby(_stream(query), key=lambda row: tuple(row[:4]))
+    for (log_id, log_user_id, timestamp, prescription), rows in logs:
+        yield {'id': log_id,
+               'user_id': log_user_id,
+               'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+               'prescription': prescription,
+               'results': [{'name': name or DELETED_DISEASE_NAME, 'probability': probability}
+                           for *_, name, probability in rows if probability is not None]}
+
+
+EXPORTS = {
+    'logs': (('id', 'user_id', 'timestamp', 'prescription', 'results'), export_logs),
+    'herbs': (('id', 'name'), export_herbs),
+    'diseases': (('id', 'name'), export_diseases),
+    'associations': (('herb_id', 'herb', 'disease_id', 'disease'), export_associations),
+}
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return ';'.join(f"{item['name']}:{item['probability']:.4f}" for item in value)
+    return value
+
+
+def to_csv(fields, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow([_csv_value(row[field]) for field in fields])
+        if i % CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def to_jsonl(fields, rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if len(lines) == CHUNK_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def encode(chunks, compress=False):
+    # 可选的gzip压缩同样逐块进行
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def parse_export_filters(username=None, start=None, end=None):
+    filters = {}
+    if username:
+        user_id = db.session.query(User.id).filter_by(username=username).scalar()
+        if user_id is None:
+            raise ValueError(f'用户不存在: {username}')
+        filters['user_id'] = user_id
+    if start:
+        filters['start'] = datetime.strptime(start, '%Y-%m-%d')
+    if end:
+        # 结束日期包含当天
+        filters['end'] = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1)
+    return filters
+
+
+def export(kind, fmt='csv', compress=False, **filters):
+    fields, rows = EXPORTS[kind]
+    if kind != 'logs':
+        # 用户与日期筛选只适用于诊断日志
+        filters = {}
+    serialize = to_csv if fmt == 'csv' else to_jsonl
+    return encode(serialize(fields, rows(**filters)), compress)
+
+
+def export_filename(kind, fmt, compress):
+    return f"{kind}-{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}" + ('.gz' if compress else '')
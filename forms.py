@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField
 from wtforms.validators import DataRequired, Email, EqualTo, ValidationError
 from models import User
@@ -50,4 +51,9 @@ class BulkAddDiseaseForm(FlaskForm):
 class BulkAddAssociationForm(FlaskForm):
     herb = StringField('中药名称', validators=[DataRequired()])
     diseases = TextAreaField('疾病列表（每行一个）', validators=[DataRequired()])
-    submit = SubmitField('批量添加关联')
\ No newline at end of file
+    submit = SubmitField('批量添加关联')
+
+class ImportFileForm(FlaskForm):
+    file = FileField('导入文件（CSV/TSV，UTF-8编码）', validators=[FileRequired(), FileAllowed(['csv', 'tsv', 'txt'], '仅支持CSV/TSV文件')])
+    has_header = BooleanField('首行为表头')
+    submit = SubmitField('导入')
@@ -0,0 +1,23 @@
+# gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = os.environ.get('GUNICORN_BIND') or '0.0.0.0:8000'
+workers = int(os.environ.get('GUNICORN_WORKERS') or 4)
+# 多个工作进程的 /metrics 通过共享目录汇总
+os.environ.setdefault('METRICS_DIR', os.path.join('cache', 'metrics'))
+
+
+def on_starting(server):
+    # 服务（重新）启动时清空上一次运行留下的指标快照
+    from metrics import clear_snapshots
+    clear_snapshots(os.environ['METRICS_DIR'])
+
+
+def post_worker_init(worker):
+    # 工作进程开始处理请求前预热，避免首个请求承担分词词典和模型的加载时间
+    from warmup import warm_up
+    try:
+        warm_up(worker.wsgi)
+    except Exception:
+        # 预热失败（如数据库不可用、尚未迁移）时不阻止工作进程启动，改为在首个请求时加载
+        worker.log.exception('工作进程预热失败，将在首个请求时加载词典和模型')
@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+from flask import current_app
+from models import db, Herb
+from model_registry import get_kb_version
+
+_END = ''
+
+
+def herb_key(herb_ids):
+    # 处方中药集合的规范写法（去重、按id排序、逗号分隔），与书写顺序无关
+    return ','.join(str(h) for h in sorted(set(herb_ids)))
+
+
+def load_jieba(cache_dir=None):
+    # 延迟导入jieba；前缀词典缓存放在固定目录，部署后首次分词无需重新构建
+    import jieba
+    if not jieba.dt.initialized:
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            jieba.dt.tmp_dir = cache_dir
+        jieba.initialize()
+    return jieba
+
+
+def _read_freq_cache(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_freq_cache(path, freqs):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(freqs, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class HerbLexicon:
+    def __init__(self, version, herbs):
+        self.version = version
+        self.index = {name: herb_id for herb_id, name in herbs}
+        self._trie = {}
+        for name in self.index:
+            node = self._trie
+            for char in name:
+                node = node.setdefault(char, {})
+            node[_END] = name
+
+    def _scan(self, text):
+        # 在字典树上做最长匹配，找出分词结果中夹带的中药名
+        herb_ids = []
+        i = 0
+        while i < len(text):
+            node = self._trie
+            matched = None
+            j = i
+            while j < len(text) and text[j] in node:
+                node = node[text[j]]
+                j += 1
+                if _END in node:
+                    matched = (node[_END], j)
+            if matched:
+                name, i = matched
+                herb_ids.append(self.index[name])
+            else:
+                i += 1
+        return herb_ids
+
+    def match(self, text):
+        import jieba
+        herb_ids = []
+        for word in jieba.cut(text):
+            herb_id = self.index.get(word)
+            if herb_id is not None:
+                herb_ids.append(herb_id)
+            elif word.strip():
+                herb_ids.extend(self._scan(word))
+        return list(dict.fromkeys(herb_ids))
+
+
+class LexiconRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lexicon = None
+        self._jieba_words = set()
+
+    def _sync_jieba(self, names):
+        jieba = load_jieba(current_app.config['JIEBA_CACHE_DIR'])
+        # 将中药名载入jieba用户词典，保证多字中药名能被正确切分
+        for name in self._jieba_words - names:
+            jieba.del_word(name)
+        # 词频计算需要逐个试切分，结果缓存在文件中，下次启动直接读取
+        cache_path = current_app.config['HERB_DICT_CACHE']
+        freqs = _read_freq_cache(cache_path)
+        missing = False
+        for name in names - self._jieba_words:
+            if name not in freqs:
+                freqs[name] = jieba.suggest_freq(name, False)
+                missing = True
+            jieba.add_word(name, freqs[name])
+        if missing:
+            _write_freq_cache(cache_path, freqs)
+        self._jieba_words = names
+
+    def get_lexicon(self, version=None):
+        if version is None:
+            version = get_kb_version()
+        lexicon = self._lexicon
+        if lexicon is not None and lexicon.version == version:
+            return lexicon
+        with self._lock:
+            if self._lexicon is None or self._lexicon.version != version:
+                herbs = db.session.query(Herb.id, Herb.name).all()
+                self._sync_jieba({name for _, name in herbs})
+                self._lexicon = HerbLexicon(version, herbs)
+            return self._lexicon
+
+
+lexicons = LexiconRegistry()
@@ -0,0 +1,72 @@
+import bisect
+import threading
+from models import db, Herb
+from model_registry import get_kb_version
+
+
+def _pinyin_keys(names):
+    # pypinyin 为可选依赖，未安装时只支持按中文名前缀提示
+    try:
+        from pypinyin import lazy_pinyin, Style
+    except ImportError:
+        return []
+    keys = []
+    for name in names:
+        keys.append((''.join(lazy_pinyin(name, style=Style.FIRST_LETTER)).lower(), name))
+        keys.append((''.join(lazy_pinyin(name)).lower(), name))
+    return keys
+
+
+class PrefixIndex:
+    # 排序后的 (键, 中药名) 列表，前缀查询用二分查找定位起点
+    def __init__(self, pairs):
+        pairs = sorted(set(pairs))
+        self.keys = [key for key, _ in pairs]
+        self.names = [name for _, name in pairs]
+
+    def search(self, prefix, limit):
+        results = []
+        i = bisect.bisect_left(self.keys, prefix)
+        while i < len(self.keys) and len(results) < limit and self.keys[i].startswith(prefix):
+            if self.names[i] not in results:
+                results.append(self.names[i])
+            i += 1
+        return results
+
+
+class HerbSuggester:
+    def __init__(self, version, names):
+        self.version = version
+        self.names = PrefixIndex((name, name) for name in names)
+        self.pinyin = PrefixIndex(_pinyin_keys(names))
+
+    def suggest(self, prefix, limit=10):
+        prefix = prefix.strip()
+        if not prefix:
+            return []
+        # 输入字母时按拼音全拼或首字母匹配
+        if prefix.isascii():
+            return self.pinyin.search(prefix.lower(), limit)
+        return self.names.search(prefix, limit)
+
+
+class SuggesterRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suggester = None
+
+    def get_suggester(self, version=None):
+        if version is None:
+            version = get_kb_version()
+        suggester = self._suggester
+        if suggester is not None and suggester.version == version:
+            return suggester
+        # 知识库版本变化（管理员增删改中药）后重新构建
+        with self._lock:
+            if self._suggester is None or self._suggester.version != version:
+                names = [name for name, in db.session.query(Herb.name)]
+                self._suggester = HerbSuggester(version, names)
+            return self._suggester
+
+
+herb_suggestions = SuggesterRegistry()
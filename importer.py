@@ -0,0 +1,137 @@
+import codecs
+import csv
+from itertools import islice
+from models import db, Herb, Disease, HerbDiseaseAssociation
+from model_registry import bump_kb_version
+
+CHUNK_SIZE = 1000
+NAME_MAX_LENGTH = 100
+
+
+class ImportReport:
+    def __init__(self):
+        self.added = 0
+        self.skipped = 0
+        self.errors = []
+
+    def error(self, line_no, message):
+        self.errors.append((line_no, message))
+
+
+def open_text(stream):
+    # 上传的文件或命令行打开的二进制文件，按UTF-8（兼容BOM）逐行读取
+    return codecs.getreader('utf-8-sig')(stream)
+
+
+def read_rows(text_stream, filename='', has_header=False):
+    delimiter = '\t' if filename.lower().endswith('.tsv') else ','
+    reader = csv.reader(text_stream, delimiter=delimiter)
+    if has_header:
+        next(reader, None)
+    for row in reader:
+        row = [value.strip() for value in row]
+        if any(row):
+            yield reader.line_num, row
+
+
+def chunks(rows, size=CHUNK_SIZE):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _commit_chunk(added):
+    # 每个分块单独提交，有新增记录时知识库版本号随分块一起递增，
+    # 中途失败时已提交的分块同样会让模型、中药词典和结果缓存更新
+    if added:
+        bump_kb_version()
+    db.session.commit()
+
+
+def _valid_name(report, line_no, name):
+    if len(name) > NAME_MAX_LENGTH:
+        report.error(line_no, f'名称超过 {NAME_MAX_LENGTH} 个字符')
+        return False
+    return True
+
+
+def import_names(model, rows):
+    report = ImportReport()
+    for chunk in chunks(rows):
+        names = {}
+        for line_no, row in chunk:
+            name = row[0]
+            if not name:
+                report.error(line_no, '名称为空')
+            elif _valid_name(report, line_no, name):
+                if name in names:
+                    report.skipped += 1
+                else:
+                    names[name] = line_no
+        # 每个分块只查询一次数据库进行去重
+        existing = {name for name, in db.session.query(model.name).filter(model.name.in_(list(names)))}
+        new_names = [name for name in names if name not in existing]
+        report.skipped += len(existing)
+        if new_names:
+            db.session.execute(model.__table__.insert(), [{'name': name} for name in new_names])
+        _commit_chunk(len(new_names))
+        report.added += len(new_names)
+    return report
+
+
+def import_herbs(rows):
+    return import_names(Herb, rows)
+
+
+def import_diseases(rows):
+    return import_names(Disease, rows)
+
+
+def import_associations(rows):
+    report = ImportReport()
+    for chunk in chunks(rows):
+        pairs = []
+        for line_no, row in chunk:
+            if len(row) < 2 or not row[0] or not row[1]:
+                report.error(line_no, '每行需要包含中药名称和疾病名称')
+            else:
+                pairs.append((line_no, row[0], row[1]))
+
+        herb_names = {herb for _, herb, _ in pairs}
+        disease_names = {disease for _, _, disease in pairs}
+        herb_ids = dict(db.session.query(Herb.name, Herb.id).filter(Herb.name.in_(list(herb_names))))
+        disease_ids = dict(db.session.query(Disease.name, Disease.id).filter(Disease.name.in_(list(disease_names))))
+        existing = {(herb_id, disease_id) for herb_id, disease_id in
+                    db.session.query(HerbDiseaseAssociation.herb_id, HerbDiseaseAssociation.disease_id)
+                    .filter(HerbDiseaseAssociation.herb_id.in_(list(herb_ids.values())),
+                            HerbDiseaseAssociation.disease_id.in_(list(disease_ids.values())))}
+
+        new_pairs = []
+        for line_no, herb, disease in pairs:
+            if herb not in herb_ids:
+                report.error(line_no, f'中药 "{herb}" 不存在')
+            elif disease not in disease_ids:
+                report.error(line_no, f'疾病 "{disease}" 不存在')
+            else:
+                pair = (herb_ids[herb], disease_ids[disease])
+                if pair in existing:
+                    report.skipped += 1
+                else:
+                    existing.add(pair)
+                    new_pairs.append(pair)
+        if new_pairs:
+            db.session.execute(HerbDiseaseAssociation.__table__.insert(),
+                               [{'herb_id': herb_id, 'disease_id': disease_id} for herb_id, disease_id in new_pairs])
+        _commit_chunk(len(new_pairs))
+        report.added += len(new_pairs)
+    return report
+
+
+IMPORTERS = {
+    'herbs': import_herbs,
+    'diseases': import_diseases,
+    'associations': import_associations,
+}
@@ -0,0 +1,171 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from models import db, DiagnosisLog, DiagnosisResult
+from herb_lexicon import herb_key
+from rollups import update_rollups
+from similarity import insert_bands
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+log_records = metrics.counter(
+    'tcm_diagnosis_log_records_total', '写入的诊断日志条数', ('mode',))
+log_flush_size = metrics.histogram(
+    'tcm_diagnosis_log_flush_size', '后台每批写入的诊断日志条数', buckets=(1, 10, 50, 100, 200, 500, 1000))
+
+_STOP = object()
+
+
+def _result_rows(model, result):
+    # 结果中的疾病可能已不在当前模型中（如读到旧知识库的缓存），这些项不保存，排名顺延
+    disease_ids = [model.disease_id_by_name.get(item['name']) for item in result]
+    known = [(disease_id, item['probability']) for disease_id, item in zip(disease_ids, result)
+             if disease_id is not None]
+    return [(disease_id, probability, rank) for rank, (disease_id, probability) in enumerate(known, start=1)]
+
+
+def build_log_records(user_id, prescriptions, herb_id_lists, results, model):
+    timestamp = datetime.utcnow()
+    return [{'user_id': user_id,
+             'prescription': prescription,
+             'timestamp': timestamp,
+             'herb_ids': herb_ids,
+             'results': _result_rows(model, result)}
+            for prescription, herb_ids, result in zip(prescriptions, herb_id_lists, results)]
+
+
+def _insert_logs(records):
+    table = DiagnosisLog.__table__
+    rows = [{'user_id': record['user_id'], 'prescription': record['prescription'],
+             'timestamp': record['timestamp'], 'herb_ids': herb_key(record['herb_ids'])}
+            for record in records]
+    if getattr(db.engine.dialect, 'full_returning', False):
+        # 支持 RETURNING 的数据库（如PostgreSQL）一条多行INSERT直接返回主键；
+        # 同一语句中的自增id按 VALUES 的顺序分配，排序后与 records 一一对应
+        result = db.session.execute(table.insert().values(rows).returning(table.c.id))
+        return sorted(log_id for log_id, in result)
+    # 其他数据库逐行插入取得主键，仍在同一事务中
+    return [db.session.execute(table.insert(), row).inserted_primary_key[0] for row in rows]
+
+
+def write_logs(records):
+    log_ids = _insert_logs(records)
+
+    # 诊断结果按排名逐行保存，一次批量插入
+    rows = [{'log_id': log_id, 'disease_id': disease_id, 'probability': probability, 'rank': rank}
+            for log_id, record in zip(log_ids, records)
+            for disease_id, probability, rank in record['results']]
+    if rows:
+        db.session.execute(DiagnosisResult.__table__.insert(), rows)
+    # 相似处方索引与汇总统计随日志在同一事务中更新
+    insert_bands((log_id, record['user_id'], record['herb_ids']) for log_id, record in zip(log_ids, records))
+    update_rollups(records)
+    db.session.commit()
+    return log_ids
+
+
+class LogWriter:
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, app):
+        self.app = app
+        self.enabled = app.config['LOG_WRITER_ASYNC']
+        self.batch_size = app.config['LOG_WRITER_BATCH_SIZE']
+        self.flush_interval = app.config['LOG_WRITER_FLUSH_MS'] / 1000
+        self.queue_size = app.config['LOG_WRITER_QUEUE_SIZE']
+        self.put_timeout = app.config['LOG_WRITER_PUT_TIMEOUT']
+
+    def _ensure_started(self):
+        # 写入线程在第一次提交时启动，预加载+fork的工作进程各自拥有自己的线程
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._thread = threading.Thread(target=self._run, name='diagnosis-log-writer', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def submit(self, records):
+        if not self.enabled:
+            write_logs(records)
+            log_records.inc(len(records), mode='sync')
+            return
+        self._ensure_started()
+        for record in records:
+            try:
+                self._queue.put(record, timeout=self.put_timeout)
+                log_records.inc(mode='async')
+            except queue.Full:
+                # 队列已满时在请求线程中同步写入，形成背压
+                write_logs([record])
+                log_records.inc(mode='overflow')
+
+    def _flush(self, batch):
+        with self.app.app_context():
+            try:
+                write_logs(batch)
+                log_flush_size.observe(len(batch))
+            except Exception:
+                db.session.rollback()
+                logger.exception('写入 %d 条诊断日志失败', len(batch))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            record = self._queue.get()
+            if record is _STOP:
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            # 攒够 batch_size 条或等待超过 flush_interval 后批量写入
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    record = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+            self._flush(batch)
+
+        remaining = []
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not _STOP:
+                remaining.append(record)
+        for start in range(0, len(remaining), self.batch_size):
+            self._flush(remaining[start:start + self.batch_size])
+
+    def stop(self, timeout=10):
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+
+log_writer = LogWriter()
+
+
+def init_log_writer(app):
+    log_writer.configure(app)
+    # 进程退出前把队列中的日志全部写入
+    atexit.register(log_writer.stop)
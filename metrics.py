@@ -0,0 +1,288 @@
+import cProfile
+import hmac
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from flask import Response, g, has_request_context, request, abort
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# 快照中标签值的分隔符
+_SEP = '\x1f'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labelnames, key):
+    return list(zip(labelnames, key.split(_SEP))) if labelnames else []
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _SEP.join(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(total, snapshot):
+        for key, value in snapshot.items():
+            total[key] = total.get(key, 0) + value
+
+    def collect(self, values):
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(_labels(self.labelnames, key))} {value}'
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _SEP.join(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(series, buckets=list(series['buckets'])) for key, series in self._series.items()}
+
+    @staticmethod
+    def merge(total, snapshot):
+        for key, series in snapshot.items():
+            current = total.get(key)
+            if current is None:
+                total[key] = dict(series, buckets=list(series['buckets']))
+                continue
+            current['buckets'] = [a + b for a, b in zip(current['buckets'], series['buckets'])]
+            current['sum'] += series['sum']
+            current['count'] += series['count']
+
+    def collect(self, snapshot):
+        for key, series in sorted(snapshot.items()):
+            labels = _labels(self.labelnames, key)
+            for bound, count in zip(self.buckets, series['buckets']):
+                yield f'{self.name}_bucket{_format_labels(labels + [("le", bound)])} {count}'
+            yield f'{self.name}_bucket{_format_labels(labels + [("le", "+Inf")])} {series["count"]}'
+            yield f'{self.name}_sum{_format_labels(labels)} {series["sum"]}'
+            yield f'{self.name}_count{_format_labels(labels)} {series["count"]}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self, snapshots=None):
+        # 多进程部署时传入所有进程的快照，按序列相加后输出
+        if snapshots is None:
+            snapshots = [self.snapshot()]
+        lines = []
+        for metric in self._metrics:
+            merged = {}
+            for snapshot in snapshots:
+                metric.merge(merged, snapshot.get(metric.name, {}))
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.collect(merged))
+        return '\n'.join(lines) + '\n'
+
+
+class SnapshotStore:
+    # 每个进程把自己的指标快照写入共享目录，/metrics 汇总目录下所有进程的快照。
+    # 已退出进程的文件保留，计数器不会因工作进程重启而回退；目录在服务启动时清空
+    def __init__(self, directory, interval=1.0):
+        self.directory = directory
+        self.interval = interval
+        self._pid = None
+        self._path = None
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, snapshot):
+        with self._lock:
+            if self._pid != os.getpid():
+                # 文件名带启动时间，避免复用的pid覆盖已退出进程的数据
+                self._pid = os.getpid()
+                self._path = os.path.join(self.directory, f'{self._pid}-{time.time_ns()}.json')
+            tmp_path = f'{self._path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path)
+            self._last_write = time.monotonic()
+
+    def write_if_due(self, snapshot_fn):
+        if time.monotonic() - self._last_write >= self.interval:
+            self.write(snapshot_fn())
+
+    def read_all(self):
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+
+def clear_snapshots(directory):
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directory, name))
+
+
+metrics = MetricsRegistry()
+
+request_duration = metrics.histogram(
+    'tcm_http_request_duration_seconds', '请求处理耗时', ('endpoint', 'method', 'status'))
+request_sql_queries = metrics.histogram(
+    'tcm_http_request_sql_queries', '每个请求执行的SQL语句数', ('endpoint',), buckets=QUERY_COUNT_BUCKETS)
+request_sql_duration = metrics.histogram(
+    'tcm_http_request_sql_duration_seconds', '每个请求执行SQL的总耗时', ('endpoint',))
+diagnosis_phase_duration = metrics.histogram(
+    'tcm_diagnosis_phase_duration_seconds', '诊断各阶段耗时', ('phase',))
+profiles_written = metrics.counter(
+    'tcm_profiles_written_total', '写入的慢请求性能剖析文件数', ('endpoint',))
+
+
+@contextmanager
+def timed_phase(phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        diagnosis_phase_duration.observe(time.perf_counter() - started, phase=phase)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    # 后台线程（如模型训练）中的查询不计入请求
+    if has_request_context() and 'sql_queries' in g:
+        g.sql_queries += 1
+        g.sql_seconds += time.perf_counter() - started
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    if context.connection is not None and context.connection.info.get('query_started'):
+        context.connection.info['query_started'].pop()
+
+
+def _metrics_allowed(app):
+    # 管理员登录后可查看；配置了 METRICS_TOKEN 时抓取程序可用 Bearer 令牌访问
+    token = app.config['METRICS_TOKEN']
+    auth = request.headers.get('Authorization', '')
+    if token and auth.startswith('Bearer ') and hmac.compare_digest(auth[len('Bearer '):], token):
+        return True
+    return current_user.is_authenticated and current_user.is_admin
+
+
+def init_metrics(app):
+    store = SnapshotStore(app.config['METRICS_DIR']) if app.config['METRICS_DIR'] else None
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_seconds = 0.0
+        rate = app.config['PROFILE_SAMPLE_RATE']
+        if rate and random.random() < rate:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'request_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_started
+        endpoint = request.endpoint or 'unknown'
+        request_duration.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+        request_sql_queries.observe(g.sql_queries, endpoint=endpoint)
+        request_sql_duration.observe(g.sql_seconds, endpoint=endpoint)
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            # 只保存超过阈值的慢请求
+            if elapsed >= app.config['PROFILE_SLOW_THRESHOLD']:
+                os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+                filename = f'{endpoint}-{datetime.utcnow():%Y%m%d-%H%M%S-%f}-{elapsed * 1000:.0f}ms.prof'
+                profiler.dump_stats(os.path.join(app.config['PROFILE_DIR'], filename))
+                profiles_written.inc(endpoint=endpoint)
+        if store is not None:
+            store.write_if_due(metrics.snapshot)
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        if not _metrics_allowed(app):
+            abort(403)
+        if store is None:
+            return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+        store.write(metrics.snapshot())
+        return Response(metrics.render(store.read_all()), mimetype='text/plain; version=0.0.4')
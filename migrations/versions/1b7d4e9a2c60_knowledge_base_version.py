@@ -0,0 +1,32 @@
+"""knowledge base version
+
+Revision ID: 1b7d4e9a2c60
+Revises: 3f1c2a9d0b11
+Create Date: 2026-10-18 09:48:26.115093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1b7d4e9a2c60'
+down_revision = '3f1c2a9d0b11'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 在加入迁移之前用 db.create_all() 创建的数据库可能已经有这张表
+    if sa.inspect(op.get_bind()).has_table('kb_version'):
+        return
+    op.create_table('kb_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('kb_version')
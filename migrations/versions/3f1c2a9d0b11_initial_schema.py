@@ -0,0 +1,66 @@
+"""initial schema
+
+Revision ID: 3f1c2a9d0b11
+Revises:
+Create Date: 2026-10-18 09:12:04.381522
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d0b11'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=64), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('password_hash', sa.String(length=128), nullable=True),
+    sa.Column('is_admin', sa.Boolean(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('herb',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('disease',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('herb_disease_association',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('herb_id', sa.Integer(), nullable=False),
+    sa.Column('disease_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['disease_id'], ['disease.id'], ),
+    sa.ForeignKeyConstraint(['herb_id'], ['herb.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('diagnosis_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('prescription', sa.String(length=500), nullable=False),
+    sa.Column('diagnosis_result', sa.String(length=500), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('diagnosis_log')
+    op.drop_table('herb_disease_association')
+    op.drop_table('disease')
+    op.drop_table('herb')
+    op.drop_table('user')
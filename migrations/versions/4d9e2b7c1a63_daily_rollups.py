@@ -0,0 +1,46 @@
+"""daily diagnosis rollups and diagnosis log herb ids
+
+Revision ID: 4d9e2b7c1a63
+Revises: e7b3a1f5c9d2
+Create Date: 2026-10-18 15:22:09.417305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d9e2b7c1a63'
+down_revision = 'e7b3a1f5c9d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('diagnosis_log', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('herb_ids', sa.Text(), nullable=True))
+
+    op.create_table('disease_daily_count',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('disease_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('top_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['disease_id'], ['disease.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('day', 'disease_id')
+    )
+    op.create_table('herb_daily_count',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('herb_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['herb_id'], ['herb.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('day', 'herb_id')
+    )
+    # 已有日志的中药id与汇总数据通过 flask rebuild-rollups 回填
+
+
+def downgrade():
+    op.drop_table('herb_daily_count')
+    op.drop_table('disease_daily_count')
+
+    with op.batch_alter_table('diagnosis_log', schema=None) as batch_op:
+        batch_op.drop_column('herb_ids')
@@ -0,0 +1,37 @@
+"""similar prescription lsh buckets
+
+Revision ID: 6c1f8e3a9b24
+Revises: 4d9e2b7c1a63
+Create Date: 2026-10-19 09:12:44.530918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1f8e3a9b24'
+down_revision = '4d9e2b7c1a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('herb_set_band',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.BigInteger(), nullable=False),
+    sa.Column('log_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['log_id'], ['diagnosis_log.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'bucket', 'log_id')
+    )
+    with op.batch_alter_table('herb_set_band', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_herb_set_band_log_id'), ['log_id'], unique=False)
+    # 已有日志的索引通过 flask rebuild-similar-index 回填
+
+
+def downgrade():
+    with op.batch_alter_table('herb_set_band', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_herb_set_band_log_id'))
+
+    op.drop_table('herb_set_band')
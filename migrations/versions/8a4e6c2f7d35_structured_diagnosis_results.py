@@ -0,0 +1,118 @@
+"""structured diagnosis results
+
+Revision ID: 8a4e6c2f7d35
+Revises: 1b7d4e9a2c60
+Create Date: 2026-10-18 10:40:17.902113
+
+"""
+import ast
+import logging
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6c2f7d35'
+down_revision = '1b7d4e9a2c60'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+
+def _literal(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def parse_results(text):
+    # 旧记录以 str(list) 保存，且可能被截断在500个字符处：
+    # 完整的记录直接解析，被截断的在最后一个完整的结果项后补上 ']' 再解析
+    items = _literal(text)
+    end = text.rfind('}')
+    while items is None and end >= 0:
+        items = _literal(text[:end + 1] + ']')
+        end = text.rfind('}', 0, end)
+    if isinstance(items, list) and all(isinstance(item, dict) for item in items):
+        return items
+    return None
+
+
+def upgrade():
+    diagnosis_result = op.create_table('diagnosis_result',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('log_id', sa.Integer(), nullable=False),
+    sa.Column('disease_id', sa.Integer(), nullable=False),
+    sa.Column('probability', sa.Float(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['disease_id'], ['disease.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['log_id'], ['diagnosis_log.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('diagnosis_result', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_diagnosis_result_disease_id'), ['disease_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_diagnosis_result_log_id'), ['log_id'], unique=False)
+
+    with op.batch_alter_table('diagnosis_log', schema=None) as batch_op:
+        batch_op.alter_column('diagnosis_result',
+               existing_type=sa.String(length=500),
+               type_=sa.Text(),
+               nullable=True)
+
+    # 回填已有的诊断日志
+    connection = op.get_bind()
+    disease_ids = dict(connection.execute(sa.text('SELECT name, id FROM disease')).fetchall())
+    last_id = 0
+    unparsed = unmatched = 0
+    while True:
+        logs = connection.execute(sa.text(
+            'SELECT id, diagnosis_result FROM diagnosis_log '
+            'WHERE id > :last_id AND diagnosis_result IS NOT NULL ORDER BY id LIMIT :limit'),
+            {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+        if not logs:
+            break
+        rows = []
+        for log_id, text in logs:
+            items = parse_results(text)
+            if items is None:
+                unparsed += 1
+                continue
+            # 排名取结果在原列表中的位置，跳过的项不影响其后各项的排名
+            for rank, item in enumerate(items, start=1):
+                name = item.get('name')
+                disease_id = disease_ids.get(name) if isinstance(name, str) else None
+                try:
+                    probability = float(item.get('probability'))
+                except (TypeError, ValueError):
+                    probability = None
+                if disease_id is None or probability is None:
+                    unmatched += 1
+                    continue
+                rows.append({'log_id': log_id, 'disease_id': disease_id,
+                             'probability': probability, 'rank': rank})
+        if rows:
+            op.bulk_insert(diagnosis_result, rows)
+        last_id = logs[-1][0]
+    if unparsed or unmatched:
+        logger.warning('回填诊断结果：%d 条日志无法解析，%d 个结果项的疾病不存在或概率无效，已跳过',
+                       unparsed, unmatched)
+
+
+def downgrade():
+    # 新记录只保存在 diagnosis_result 表中，旧列需要非空值
+    op.execute("UPDATE diagnosis_log SET diagnosis_result = '[]' WHERE diagnosis_result IS NULL")
+    with op.batch_alter_table('diagnosis_log', schema=None) as batch_op:
+        batch_op.alter_column('diagnosis_result',
+               existing_type=sa.Text(),
+               type_=sa.String(length=500),
+               nullable=False)
+
+    with op.batch_alter_table('diagnosis_result', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_diagnosis_result_log_id'))
+        batch_op.drop_index(batch_op.f('ix_diagnosis_result_disease_id'))
+
+    op.drop_table('diagnosis_result')
@@ -0,0 +1,62 @@
+"""keep diagnosis results of deleted diseases
+
+Revision ID: 9e5a7d3c2f18
+Revises: 6c1f8e3a9b24
+Create Date: 2026-10-19 10:05:31.274610
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e5a7d3c2f18'
+down_revision = '6c1f8e3a9b24'
+branch_labels = None
+depends_on = None
+
+FOREIGN_KEY = 'fk_diagnosis_result_disease_id_disease'
+
+
+def _diagnosis_result(nullable, ondelete):
+    metadata = sa.MetaData()
+    sa.Table('disease', metadata, sa.Column('id', sa.Integer(), primary_key=True))
+    sa.Table('diagnosis_log', metadata, sa.Column('id', sa.Integer(), primary_key=True))
+    return sa.Table('diagnosis_result', metadata,
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('log_id', sa.Integer(), nullable=False),
+    sa.Column('disease_id', sa.Integer(), nullable=nullable),
+    sa.Column('probability', sa.Float(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['disease_id'], ['disease.id'], name=FOREIGN_KEY, ondelete=ondelete),
+    sa.ForeignKeyConstraint(['log_id'], ['diagnosis_log.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.Index('ix_diagnosis_result_disease_id', 'disease_id'),
+    sa.Index('ix_diagnosis_result_log_id', 'log_id')
+    )
+
+
+def _alter(nullable, ondelete):
+    if op.get_bind().dialect.name == 'sqlite':
+        # SQLite 不能单独修改外键，按新的表定义重建
+        with op.batch_alter_table('diagnosis_result', copy_from=_diagnosis_result(nullable, ondelete),
+                                  recreate='always'):
+            pass
+        return
+    names = [fk['name'] for fk in sa.inspect(op.get_bind()).get_foreign_keys('diagnosis_result')
+             if fk['constrained_columns'] == ['disease_id'] and fk['name']]
+    with op.batch_alter_table('diagnosis_result', schema=None) as batch_op:
+        for name in names:
+            batch_op.drop_constraint(name, type_='foreignkey')
+        batch_op.alter_column('disease_id', existing_type=sa.Integer(), nullable=nullable)
+        batch_op.create_foreign_key(FOREIGN_KEY, 'disease', ['disease_id'], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    # 删除疾病时不再级联删除用户的诊断结果，只清空疾病id
+    _alter(True, 'SET NULL')
+
+
+def downgrade():
+    op.execute('DELETE FROM diagnosis_result WHERE disease_id IS NULL')
+    _alter(False, 'CASCADE')
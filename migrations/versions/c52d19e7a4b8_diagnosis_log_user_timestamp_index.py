@@ -0,0 +1,26 @@
+"""diagnosis log user timestamp index
+
+Revision ID: c52d19e7a4b8
+Revises: 8a4e6c2f7d35
+Create Date: 2026-10-18 11:26:53.550671
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52d19e7a4b8'
+down_revision = '8a4e6c2f7d35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('diagnosis_log', schema=None) as batch_op:
+        batch_op.create_index('ix_diagnosis_log_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('diagnosis_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_diagnosis_log_user_id_timestamp')
@@ -0,0 +1,40 @@
+"""indexes and unique herb disease association
+
+Revision ID: e7b3a1f5c9d2
+Revises: c52d19e7a4b8
+Create Date: 2026-10-18 13:05:41.218760
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3a1f5c9d2'
+down_revision = 'c52d19e7a4b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 删除重复的中药-疾病关联，每对只保留最早的一条
+    op.execute(
+        'DELETE FROM herb_disease_association WHERE id NOT IN ('
+        'SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM herb_disease_association '
+        'GROUP BY herb_id, disease_id) AS keep)')
+
+    with op.batch_alter_table('herb_disease_association', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_herb_disease_association_herb_id_disease_id', ['herb_id', 'disease_id'])
+        batch_op.create_index(batch_op.f('ix_herb_disease_association_disease_id'), ['disease_id'], unique=False)
+
+    with op.batch_alter_table('diagnosis_log', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_diagnosis_log_timestamp'), ['timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('diagnosis_log', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_diagnosis_log_timestamp'))
+
+    with op.batch_alter_table('herb_disease_association', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_herb_disease_association_disease_id'))
+        batch_op.drop_constraint('uq_herb_disease_association_herb_id_disease_id', type_='unique')
@@ -0,0 +1,91 @@
+import json
+import os
+import re
+import shutil
+from contextlib import contextmanager
+from datetime import datetime
+from scoring import load_scorer
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+META_FILE = 'meta.json'
+
+
+def artifact_path(directory, backend, version):
+    return os.path.join(directory, f'{backend}-v{version}')
+
+
+@contextmanager
+def file_lock(path):
+    # 多个工作进程同时发现新版本时只由一个进程训练，其余进程等待后直接加载
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def write_artifacts(path, model, stamp):
+    import numpy as np
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    try:
+        np.save(os.path.join(tmp_path, 'herb_ids.npy'), np.asarray(model.herb_ids, dtype=np.int64))
+        np.save(os.path.join(tmp_path, 'disease_ids.npy'), np.asarray(model.disease_ids, dtype=np.int64))
+        model.scorer.save(tmp_path)
+        meta = {'version': model.version,
+                'backend': model.scorer.name,
+                'kb_stamp': stamp,
+                'disease_names': model.disease_names,
+                'trained_at': model.trained_at.isoformat(),
+                'train_seconds': model.train_seconds}
+        with open(os.path.join(tmp_path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        # 整个目录写完后再改名，其他进程不会读到写了一半的文件；
+        # 旧目录可能仍被其他进程映射，删除后已映射的内容依然有效
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_path, path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def read_artifacts(path, stamp):
+    import numpy as np
+    try:
+        with open(os.path.join(path, META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # 数据库重建后版本号可能重复，用知识库版本的更新时间区分
+    if meta.get('kb_stamp') != stamp:
+        return None
+    # 其他进程清理旧版本时目录可能在读取过程中被删除，读取失败按没有模型文件处理，由调用方重新训练
+    try:
+        herb_ids = np.load(os.path.join(path, 'herb_ids.npy'), mmap_mode='r')
+        disease_ids = np.load(os.path.join(path, 'disease_ids.npy')).tolist()
+        scorer = load_scorer(meta['backend'], path)
+    except (OSError, ValueError):
+        return None
+    meta['trained_at'] = datetime.fromisoformat(meta['trained_at'])
+    return meta, herb_ids, disease_ids, scorer
+
+
+def prune_artifacts(directory, backend, keep=2):
+    pattern = re.compile(rf'^{re.escape(backend)}-v(\d+)$')
+    versions = sorted((int(match.group(1)), name)
+                      for match, name in ((pattern.match(name), name) for name in os.listdir(directory))
+                      if match)
+    for version, name in versions[:-keep]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        try:
+            os.remove(os.path.join(directory, f'{name}.lock'))
+        except OSError:
+            pass
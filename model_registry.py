@@ -0,0 +1,215 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import chain
+from flask import current_app
+from models import db, Herb, Disease, HerbDiseaseAssociation, KnowledgeBaseVersion
+from scoring import create_scorer
+from model_artifacts import artifact_path, file_lock, read_artifacts, write_artifacts, prune_artifacts
+
+logger = logging.getLogger(__name__)
+
+
+def get_kb_version():
+    version = db.session.query(KnowledgeBaseVersion.version).filter_by(id=1).scalar()
+    return version or 0
+
+
+def get_kb_stamp(version):
+    # 知识库版本号与更新时间共同标识一份模型文件；还没有版本记录时不使用模型文件
+    updated_at = db.session.query(KnowledgeBaseVersion.updated_at) \
+        .filter_by(id=1, version=version).scalar()
+    return f'{version}:{updated_at.isoformat()}' if updated_at else None
+
+
+def bump_kb_version():
+    # 在调用方的事务中递增知识库版本号，随中药/疾病/关联的修改一起提交
+    updated = KnowledgeBaseVersion.query.filter_by(id=1).update(
+        {KnowledgeBaseVersion.version: KnowledgeBaseVersion.version + 1},
+        synchronize_session=False)
+    if not updated:
+        db.session.add(KnowledgeBaseVersion(id=1, version=1))
+
+
+def commit_kb_changes():
+    bump_kb_version()
+    db.session.commit()
+    registry.schedule_retrain()
+
+
+class DiagnosisModel:
+    def __init__(self, version, herb_ids, disease_ids, disease_names, scorer):
+        self.version = version
+        # 按id升序排列的中药id（numpy数组，可能是只读内存映射）
+        self.herb_ids = herb_ids
+        self.disease_ids = disease_ids
+        self.disease_names = disease_names
+        self.disease_id_by_name = dict(zip(disease_names, disease_ids))
+        self.scorer = scorer
+        self.trained_at = None
+        self.train_seconds = None
+        self.source = 'trained'
+        # 训练时的知识库标识（版本号:更新时间），还没有版本记录时为 None
+        self.kb_stamp = None
+
+    def featurize(self, herb_id_lists):
+        import numpy as np
+        from scipy import sparse
+        rows = np.repeat(np.arange(len(herb_id_lists)), [len(herb_ids) for herb_ids in herb_id_lists])
+        ids = np.fromiter(chain.from_iterable(herb_id_lists), dtype=np.int64, count=len(rows))
+        # 二分查找中药id对应的列号，知识库中已不存在的中药忽略
+        columns = np.searchsorted(self.herb_ids, ids)
+        known = columns < len(self.herb_ids)
+        known[known] = self.herb_ids[columns[known]] == ids[known]
+        X = sparse.csr_matrix((np.ones(int(known.sum())), (rows[known], columns[known])),
+                              shape=(len(herb_id_lists), len(self.herb_ids)))
+        X.data[:] = 1
+        return X
+
+    def predict_proba(self, X):
+        return self.scorer.predict_proba(X)
+
+    def results(self, probabilities):
+        result = [{'name': self.disease_names[i], 'probability': float(prob)}
+                  for i, prob in enumerate(probabilities) if prob > 0]
+        result.sort(key=lambda x: x['probability'], reverse=True)
+        return result
+
+
+def train_model(version, backend):
+    import numpy as np
+    from scipy import sparse
+    herb_ids = np.array([herb_id for herb_id, in db.session.query(Herb.id).order_by(Herb.id)], dtype=np.int64)
+    diseases = db.session.query(Disease.id, Disease.name).order_by(Disease.id).all()
+    pairs = db.session.query(HerbDiseaseAssociation.herb_id, HerbDiseaseAssociation.disease_id).all()
+
+    herb_index = {herb_id: i for i, herb_id in enumerate(herb_ids)}
+    disease_index = {disease_id: i for i, (disease_id, _) in enumerate(diseases)}
+
+    # 中药×疾病关联矩阵（CSR）
+    rows = [herb_index[herb_id] for herb_id, _ in pairs]
+    columns = [disease_index[disease_id] for _, disease_id in pairs]
+    incidence = sparse.csr_matrix((np.ones(len(pairs)), (rows, columns)),
+                                  shape=(len(herb_ids), len(diseases)))
+    # 重复的关联记录会被累加，这里统一为0/1
+    incidence.data[:] = 1
+
+    scorer = create_scorer(backend).fit(incidence)
+    return DiagnosisModel(version, herb_ids, [disease_id for disease_id, _ in diseases],
+                          [name for _, name in diseases], scorer)
+
+
+def load_model(path, stamp):
+    # 从模型文件加载（只读内存映射），文件不存在或不属于当前知识库时返回 None
+    artifacts = read_artifacts(path, stamp)
+    if artifacts is None:
+        return None
+    meta, herb_ids, disease_ids, scorer = artifacts
+    model = DiagnosisModel(meta['version'], herb_ids, disease_ids, meta['disease_names'], scorer)
+    model.trained_at = meta['trained_at']
+    model.train_seconds = meta['train_seconds']
+    model.source = 'artifact'
+    model.kb_stamp = stamp
+    return model
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+        self._scheduled = set()
+        self._training = set()
+        # 单线程执行器：后台训练新模型，线上请求继续使用旧模型
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-retrain')
+
+    def _fit(self, version, backend, stamp):
+        started = time.perf_counter()
+        model = train_model(version, backend)
+        model.train_seconds = time.perf_counter() - started
+        model.trained_at = datetime.utcnow()
+        model.kb_stamp = stamp
+        return model
+
+    def _train(self, version, backend):
+        directory = current_app.config['MODEL_ARTIFACT_DIR']
+        stamp = get_kb_stamp(version)
+        if stamp is None or not directory:
+            return self._fit(version, backend, stamp)
+        # 优先加载其他进程已写好的模型文件，没有时由一个进程训练并写入
+        path = artifact_path(directory, backend, version)
+        model = load_model(path, stamp)
+        if model is None:
+            with file_lock(f'{path}.lock'):
+                model = load_model(path, stamp)
+                if model is None:
+                    model = self._fit(version, backend, stamp)
+                    write_artifacts(path, model, stamp)
+                    prune_artifacts(directory, backend)
+        return model
+
+    def get_model(self, backend=None, version=None):
+        backend = backend or current_app.config['SCORING_BACKEND']
+        if version is None:
+            version = get_kb_version()
+        model = self._models.get(backend)
+        if model is not None:
+            if model.version != version:
+                self.schedule_retrain(backend)
+            return model
+        # 冷启动时还没有可用的模型，只能同步训练
+        with self._lock:
+            model = self._models.get(backend)
+            if model is None:
+                model = self._train(version, backend)
+                self._models[backend] = model
+            return model
+
+    def schedule_retrain(self, backend=None):
+        app = current_app._get_current_object()
+        backend = backend or app.config['SCORING_BACKEND']
+        with self._lock:
+            # 已经排队的训练会读取最新版本，连续的修改合并为一次训练
+            if backend in self._scheduled:
+                return
+            self._scheduled.add(backend)
+        self._executor.submit(self._retrain, app, backend)
+
+    def _retrain(self, app, backend):
+        with app.app_context():
+            try:
+                time.sleep(app.config['MODEL_RETRAIN_DELAY'])
+                with self._lock:
+                    self._scheduled.discard(backend)
+                    self._training.add(backend)
+                version = get_kb_version()
+                current = self._models.get(backend)
+                if current is None or current.version != version:
+                    model = self._train(version, backend)
+                    with self._lock:
+                        self._models[backend] = model
+                    logger.info('模型 %s 已更新到知识库版本 %s，训练耗时 %.2f 秒',
+                                backend, version, model.train_seconds)
+            except Exception:
+                logger.exception('后台训练模型 %s 失败', backend)
+            finally:
+                with self._lock:
+                    self._scheduled.discard(backend)
+                    self._training.discard(backend)
+
+    def status(self):
+        with self._lock:
+            models = dict(self._models)
+            scheduled = set(self._scheduled)
+            training = set(self._training)
+        return {backend: {'version': model.version,
+                          'trained_at': model.trained_at.isoformat(),
+                          'train_seconds': model.train_seconds,
+                          'source': model.source,
+                          'retrain_scheduled': backend in scheduled,
+                          'training': backend in training}
+                for backend, model in models.items()}
+
+
+registry = ModelRegistry()
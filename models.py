@@ -5,6 +5,8 @@ from datetime import datetime
 
 db = SQLAlchemy()
 
+DELETED_DISEASE_NAME = '（已删除的疾病）'
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
@@ -32,15 +34,66 @@ class Disease(db.Model):
 
 class HerbDiseaseAssociation(db.Model):
     __tablename__ = 'herb_disease_association'
+    __table_args__ = (db.UniqueConstraint('herb_id', 'disease_id', name='uq_herb_disease_association_herb_id_disease_id'),)
     id = db.Column(db.Integer, primary_key=True)
     herb_id = db.Column(db.Integer, db.ForeignKey('herb.id'), nullable=False)
-    disease_id = db.Column(db.Integer, db.ForeignKey('disease.id'), nullable=False)
+    disease_id = db.Column(db.Integer, db.ForeignKey('disease.id'), nullable=False, index=True)
     herb = db.relationship('Herb', back_populates='herb_associations')
     disease = db.relationship('Disease', back_populates='disease_associations')
 
 class DiagnosisLog(db.Model):
+    __table_args__ = (db.Index('ix_diagnosis_log_user_id_timestamp', 'user_id', 'timestamp'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     prescription = db.Column(db.String(500), nullable=False)
-    diagnosis_result = db.Column(db.String(500), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    # 处方中识别出的中药id（排序后逗号分隔），用于汇总统计与相似处方检索
+    herb_ids = db.Column(db.Text)
+    # 旧版本以字符串保存的诊断结果，新记录使用 DiagnosisResult
+    diagnosis_result = db.Column(db.Text)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    results = db.relationship('DiagnosisResult', back_populates='log', order_by='DiagnosisResult.rank',
+                              cascade='all, delete-orphan')
+
+class DiagnosisResult(db.Model):
+    __tablename__ = 'diagnosis_result'
+    id = db.Column(db.Integer, primary_key=True)
+    log_id = db.Column(db.Integer, db.ForeignKey('diagnosis_log.id', ondelete='CASCADE'), nullable=False, index=True)
+    # 删除疾病时保留用户的诊断历史，只清空疾病id
+    disease_id = db.Column(db.Integer, db.ForeignKey('disease.id', ondelete='SET NULL'), index=True)
+    probability = db.Column(db.Float, nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    log = db.relationship('DiagnosisLog', back_populates='results')
+    disease = db.relationship('Disease')
+
+    @property
+    def disease_name(self):
+        # 疾病被删除后（疾病id已清空，或SQLite未启用外键时指向不存在的记录）显示为已删除
+        return self.disease.name if self.disease is not None else DELETED_DISEASE_NAME
+
+class KnowledgeBaseVersion(db.Model):
+    __tablename__ = 'kb_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DiseaseDailyCount(db.Model):
+    # 按天汇总的疾病诊断次数，写入诊断日志时同步累加
+    __tablename__ = 'disease_daily_count'
+    day = db.Column(db.Date, primary_key=True)
+    disease_id = db.Column(db.Integer, db.ForeignKey('disease.id', ondelete='CASCADE'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    top_count = db.Column(db.Integer, nullable=False, default=0)
+
+class HerbSetBand(db.Model):
+    # 诊断日志中药集合的MinHash分段哈希（LSH桶），写入诊断日志时同步写入，用于检索相似处方
+    __tablename__ = 'herb_set_band'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    bucket = db.Column(db.BigInteger, primary_key=True)
+    log_id = db.Column(db.Integer, db.ForeignKey('diagnosis_log.id', ondelete='CASCADE'), primary_key=True, index=True)
+
+class HerbDailyCount(db.Model):
+    # 按天汇总的中药使用次数
+    __tablename__ = 'herb_daily_count'
+    day = db.Column(db.Date, primary_key=True)
+    herb_id = db.Column(db.Integer, db.ForeignKey('herb.id', ondelete='CASCADE'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,141 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from metrics import metrics
+from herb_lexicon import herb_key
+
+cache_requests = metrics.counter(
+    'tcm_result_cache_requests_total', '诊断结果缓存查询次数', ('result',))
+
+
+def cache_key(model, herb_ids):
+    # 同一组中药（与顺序、写法无关）在同一知识库下的诊断结果相同。
+    # 数据库重建后版本号会重新计数，键中带上版本的更新时间，避免共享缓存返回旧知识库的结果；
+    # 还没有版本记录时无法区分，不使用缓存
+    if model.kb_stamp is None:
+        return None
+    return f'{model.scorer.name}:{model.kb_stamp}:{herb_key(herb_ids)}'
+
+
+class LRUCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheStore:
+    # 多个工作进程共享的本地缓存文件
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # 建表使用临时连接，避免预加载时在主进程中留下会被fork继承的连接
+        with closing(sqlite3.connect(path, timeout=1)) as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS result_cache '
+                               '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)')
+            connection.commit()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        try:
+            row = self._connection().execute('SELECT value FROM result_cache WHERE key = ? AND expires_at > ?',
+                                             (key, time.time())).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        connection = self._connection()
+        try:
+            connection.execute('INSERT OR REPLACE INTO result_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                               (key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl))
+            # 偶尔清理过期的记录
+            if random.random() < 0.01:
+                connection.execute('DELETE FROM result_cache WHERE expires_at <= ?', (time.time(),))
+            connection.commit()
+        except sqlite3.OperationalError:
+            # 共享缓存写入失败（如被锁）不影响诊断
+            connection.rollback()
+
+
+class ResultCache:
+    def __init__(self):
+        self.local = None
+        self.shared = None
+
+    def configure(self, max_size, ttl, shared_path=None):
+        self.local = LRUCache(max_size, ttl) if max_size else None
+        self.shared = SQLiteCacheStore(shared_path, ttl) if shared_path else None
+
+    def get(self, key):
+        if self.local is not None:
+            value = self.local.get(key)
+            if value is not None:
+                cache_requests.inc(result='hit_local')
+                return value
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                cache_requests.inc(result='hit_shared')
+                if self.local is not None:
+                    self.local.set(key, value)
+                return value
+        cache_requests.inc(result='miss')
+        return None
+
+    def set(self, key, value):
+        if self.local is not None:
+            self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    @property
+    def enabled(self):
+        return self.local is not None or self.shared is not None
+
+
+result_cache = ResultCache()
+
+
+def init_result_cache(app):
+    result_cache.configure(app.config['RESULT_CACHE_SIZE'], app.config['RESULT_CACHE_TTL'],
+                           app.config['RESULT_CACHE_SHARED_PATH'])
@@ -0,0 +1,164 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, case, func
+from models import db, Herb, Disease, DiagnosisLog, DiagnosisResult, DiseaseDailyCount, HerbDailyCount
+from herb_lexicon import lexicons, herb_key
+
+REBUILD_CHUNK_SIZE = 5000
+
+
+def _upsert_counts(model, key_columns, rows):
+    if not rows:
+        return
+    table = model.__table__
+    count_columns = [name for name in rows[0] if name not in key_columns]
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=key_columns,
+                                          set_={name: table.c[name] + stmt.excluded[name] for name in count_columns})
+        db.session.execute(stmt, rows)
+    elif dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update({name: table.c[name] + stmt.inserted[name] for name in count_columns})
+        db.session.execute(stmt, rows)
+    else:
+        for row in rows:
+            updated = db.session.execute(
+                table.update()
+                .where(*[table.c[name] == row[name] for name in key_columns])
+                .values({name: table.c[name] + row[name] for name in count_columns})).rowcount
+            if not updated:
+                db.session.execute(table.insert(), [row])
+
+
+def update_rollups(records):
+    # 在写入诊断日志的同一事务中累加按天汇总的计数
+    disease_counts = Counter()
+    disease_top_counts = Counter()
+    herb_counts = Counter()
+    for record in records:
+        day = record['timestamp'].date()
+        for disease_id, _, rank in record['results']:
+            disease_counts[(day, disease_id)] += 1
+            if rank == 1:
+                disease_top_counts[(day, disease_id)] += 1
+        for herb_id in set(record['herb_ids']):
+            herb_counts[(day, herb_id)] += 1
+    _upsert_counts(DiseaseDailyCount, ['day', 'disease_id'],
+                   [{'day': day, 'disease_id': disease_id, 'count': count,
+                     'top_count': disease_top_counts[(day, disease_id)]}
+                    for (day, disease_id), count in disease_counts.items()])
+    _upsert_counts(HerbDailyCount, ['day', 'herb_id'],
+                   [{'day': day, 'herb_id': herb_id, 'count': count}
+                    for (day, herb_id), count in herb_counts.items()])
+
+
+def _as_date(value):
+    # SQLite 的 date() 返回字符串
+    if isinstance(value, str):
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def backfill_herb_ids(chunk_size=REBUILD_CHUNK_SIZE):
+    lexicon = None
+    stmt = DiagnosisLog.__table__.update() \
+        .where(DiagnosisLog.id == bindparam('log_id')) \
+        .values(herb_ids=bindparam('new_herb_ids'))
+    updated = 0
+    last_id = 0
+    while True:
+        logs = db.session.query(DiagnosisLog.id, DiagnosisLog.prescription) \
+            .filter(DiagnosisLog.herb_ids.is_(None), DiagnosisLog.id > last_id) \
+            .order_by(DiagnosisLog.id).limit(chunk_size).all()
+        if not logs:
+            return updated
+        if lexicon is None:
+            lexicon = lexicons.get_lexicon()
+        db.session.execute(stmt, [{'log_id': log_id, 'new_herb_ids': herb_key(lexicon.match(prescription))}
+                                  for log_id, prescription in logs])
+        db.session.commit()
+        updated += len(logs)
+        last_id = logs[-1][0]
+
+
+def rebuild_rollups(chunk_size=REBUILD_CHUNK_SIZE):
+    # 离线命令：清空后重新汇总，与写入日志时的增量累加没有协调，运行期间新写入的日志可能被重复或漏计，
+    # 应在停止服务时执行
+    backfilled = backfill_herb_ids(chunk_size)
+
+    DiseaseDailyCount.query.delete()
+    HerbDailyCount.query.delete()
+
+    day = func.date(DiagnosisLog.timestamp)
+    disease_rows = db.session.query(day, DiagnosisResult.disease_id, func.count(DiagnosisResult.id),
+                                    func.sum(case((DiagnosisResult.rank == 1, 1), else_=0))) \
+        .join(DiagnosisResult, DiagnosisResult.log_id == DiagnosisLog.id) \
+        .filter(DiagnosisResult.disease_id.isnot(None)) \
+        .group_by(day, DiagnosisResult.disease_id).all()
+    if disease_rows:
+        db.session.execute(DiseaseDailyCount.__table__.insert(),
+                           [{'day': _as_date(d), 'disease_id': disease_id, 'count': count, 'top_count': top_count or 0}
+                            for d, disease_id, count, top_count in disease_rows])
+
+    # 中药以逗号分隔保存在日志中，分块读取后在内存中汇总
+    herb_counts = Counter()
+    query = db.session.query(DiagnosisLog.timestamp, DiagnosisLog.herb_ids) \
+        .filter(DiagnosisLog.herb_ids != '') \
+        .yield_per(chunk_size)
+    for timestamp, herb_ids in query:
+        d = timestamp.date()
+        for herb_id in herb_ids.split(','):
+            herb_counts[(d, int(herb_id))] += 1
+    rows = [{'day': d, 'herb_id': herb_id, 'count': count} for (d, herb_id), count in herb_counts.items()]
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(HerbDailyCount.__table__.insert(), rows[start:start + chunk_size])
+    db.session.commit()
+    return {'backfilled_logs': backfilled, 'disease_rows': len(disease_rows), 'herb_rows': len(rows)}
+
+
+def _period(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def top_series(model, key_column, name_model, start, end, granularity='day', limit=10):
+    # 先取区间内总数最多的前 limit 项，再取它们按天/周的计数
+    key = getattr(model, key_column)
+    top = db.session.query(key, name_model.name, func.sum(model.count).label('total')) \
+        .join(name_model, name_model.id == key) \
+        .filter(model.day >= start, model.day <= end) \
+        .group_by(key, name_model.name) \
+        .order_by(func.sum(model.count).desc()) \
+        .limit(limit).all()
+    names = {item_id: name for item_id, name, _ in top}
+    series = {name: Counter() for name in names.values()}
+    if names:
+        rows = db.session.query(model.day, key, model.count) \
+            .filter(model.day >= start, model.day <= end, key.in_(list(names))).all()
+        for day, item_id, count in rows:
+            series[names[item_id]][_period(_as_date(day), granularity)] += count
+    return [(name, total) for _, name, total in top], series
+
+
+def disease_series(start, end, granularity='day', limit=10):
+    return top_series(DiseaseDailyCount, 'disease_id', Disease, start, end, granularity, limit)
+
+
+def herb_series(start, end, granularity='day', limit=10):
+    return top_series(HerbDailyCount, 'herb_id', Herb, start, end, granularity, limit)
+
+
+def default_range(days):
+    # 汇总按UTC日期分桶，区间同样按UTC计算
+    end = datetime.utcnow().date()
+    return end - timedelta(days=days - 1), end
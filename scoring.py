@@ -0,0 +1,110 @@
+# numpy/scipy/scikit-learn 在首次训练或预测时才导入，加快进程启动
+import os
+
+
+class RandomForestScorer:
+    name = 'random_forest'
+
+    def __init__(self, n_estimators=100):
+        self.n_estimators = n_estimators
+        self.clf = None
+        self.n_diseases = 0
+
+    def fit(self, incidence):
+        from scipy import sparse
+        from sklearn.multioutput import MultiOutputClassifier
+        from sklearn.ensemble import RandomForestClassifier
+        n_herbs, self.n_diseases = incidence.shape
+        if n_herbs and self.n_diseases:
+            # 训练数据：每味中药一行（单位矩阵），标签为该中药关联的疾病
+            X = sparse.identity(n_herbs, format='csr')
+            y = incidence.toarray()
+            self.clf = MultiOutputClassifier(RandomForestClassifier(n_estimators=self.n_estimators))
+            self.clf.fit(X, y)
+        return self
+
+    def predict_proba(self, X):
+        import numpy as np
+        probabilities = np.zeros((X.shape[0], self.n_diseases))
+        if self.clf is None:
+            return probabilities
+        for i, estimator in enumerate(self.clf.estimators_):
+            # 某个疾病在训练数据中没有正样本时，分类器只有一个类别
+            classes = list(estimator.classes_)
+            if 1 in classes:
+                probabilities[:, i] = estimator.predict_proba(X)[:, classes.index(1)]
+        return probabilities
+
+    def save(self, directory):
+        import joblib
+        joblib.dump({'clf': self.clf, 'n_diseases': self.n_diseases}, os.path.join(directory, 'forest.joblib'))
+
+    @classmethod
+    def load(cls, directory):
+        import joblib
+        # 树的节点数组在反序列化时会被复制，这里省去的是每个进程重复训练的时间
+        state = joblib.load(os.path.join(directory, 'forest.joblib'), mmap_mode='r')
+        scorer = cls()
+        scorer.clf = state['clf']
+        scorer.n_diseases = state['n_diseases']
+        return scorer
+
+
+class SparseIncidenceScorer:
+    name = 'sparse'
+
+    def __init__(self):
+        self.incidence = None
+
+    def fit(self, incidence):
+        import numpy as np
+        from scipy import sparse
+        self.incidence = sparse.csr_matrix(incidence, dtype=np.float64)
+        return self
+
+    def predict_proba(self, X):
+        import numpy as np
+        from scipy import sparse
+        X = sparse.csr_matrix(X, dtype=np.float64)
+        # 每个疾病的得分 = 处方中与该疾病关联的中药数 / 处方中匹配到的中药数
+        counts = (X @ self.incidence).toarray()
+        herb_counts = np.asarray(X.sum(axis=1)).ravel()
+        herb_counts[herb_counts == 0] = 1
+        return counts / herb_counts[:, None]
+
+    def save(self, directory):
+        import numpy as np
+        for part in ('data', 'indices', 'indptr'):
+            np.save(os.path.join(directory, f'incidence_{part}.npy'), getattr(self.incidence, part))
+        np.save(os.path.join(directory, 'incidence_shape.npy'), np.array(self.incidence.shape))
+
+    @classmethod
+    def load(cls, directory):
+        import numpy as np
+        from scipy import sparse
+        # 只读内存映射，同一版本的矩阵由所有工作进程通过页缓存共享
+        data, indices, indptr = (np.load(os.path.join(directory, f'incidence_{part}.npy'), mmap_mode='r')
+                                 for part in ('data', 'indices', 'indptr'))
+        shape = tuple(int(n) for n in np.load(os.path.join(directory, 'incidence_shape.npy')))
+        scorer = cls()
+        scorer.incidence = sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+        return scorer
+
+
+SCORERS = {
+    RandomForestScorer.name: RandomForestScorer,
+    SparseIncidenceScorer.name: SparseIncidenceScorer,
+}
+
+
+def create_scorer(name):
+    try:
+        return SCORERS[name]()
+    except KeyError:
+        raise ValueError(f'未知的评分后端: {name}')
+
+
+def load_scorer(name, directory):
+    if name not in SCORERS:
+        raise ValueError(f'未知的评分后端: {name}')
+    return SCORERS[name].load(directory)
@@ -0,0 +1,114 @@
+import heapq
+from functools import lru_cache
+from itertools import chain
+from flask import current_app
+from models import db, DiagnosisLog, HerbSetBand
+from rollups import backfill_herb_ids
+
+MERSENNE_PRIME = (1 << 31) - 1
+REBUILD_CHUNK_SIZE = 10000
+
+
+class MinHasher:
+    def __init__(self, num_perm=64, seed=1):
+        import numpy as np
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self._a = rng.randint(1, MERSENNE_PRIME, size=(num_perm, 1)).astype(np.int64)
+        self._b = rng.randint(0, MERSENNE_PRIME, size=(num_perm, 1)).astype(np.int64)
+
+    def signatures(self, herb_id_lists):
+        import numpy as np
+        lengths = [len(herb_ids) for herb_ids in herb_id_lists]
+        ids = np.fromiter(chain.from_iterable(herb_id_lists), dtype=np.int64, count=sum(lengths))
+        offsets = np.cumsum([0] + lengths[:-1])
+        # 所有集合一次计算哈希，再按集合分段取最小值
+        hashes = (self._a * ids + self._b) % MERSENNE_PRIME
+        return np.minimum.reduceat(hashes, offsets, axis=1).T
+
+    def band_keys(self, herb_id_lists, bands):
+        # 签名分为 bands 段，每段（连同段号）合成一个63位整数作为LSH桶，任一段相同即为候选
+        import numpy as np
+        if self.num_perm % bands:
+            raise ValueError('SIMILAR_NUM_PERM 必须是 SIMILAR_BANDS 的整数倍')
+        signatures = self.signatures(herb_id_lists).astype(np.uint64)
+        signatures = signatures.reshape(len(herb_id_lists), bands, self.num_perm // bands)
+        keys = np.broadcast_to(np.arange(1, bands + 1, dtype=np.uint64), signatures.shape[:2]).copy()
+        for row in range(signatures.shape[2]):
+            keys = keys * np.uint64(1000003) + signatures[:, :, row]
+        return (keys & np.uint64((1 << 63) - 1)).astype(np.int64)
+
+
+@lru_cache(maxsize=None)
+def get_hasher(num_perm):
+    return MinHasher(num_perm)
+
+
+def band_rows(logs):
+    # logs 为 (log_id, user_id, 中药id列表)，没有识别出中药的日志不建索引
+    logs = [(log_id, user_id, herb_ids) for log_id, user_id, herb_ids in logs if herb_ids]
+    if not logs:
+        return []
+    hasher = get_hasher(current_app.config['SIMILAR_NUM_PERM'])
+    keys = hasher.band_keys([sorted(set(herb_ids)) for _, _, herb_ids in logs], current_app.config['SIMILAR_BANDS'])
+    return [{'user_id': user_id, 'bucket': bucket, 'log_id': log_id}
+            for (log_id, user_id, _), row in zip(logs, keys)
+            for bucket in dict.fromkeys(row.tolist())]
+
+
+def insert_bands(logs):
+    rows = band_rows(logs)
+    if rows:
+        db.session.execute(HerbSetBand.__table__.insert(), rows)
+
+
+def _parse_herb_ids(herb_ids):
+    return [int(h) for h in herb_ids.split(',')] if herb_ids else []
+
+
+def find_similar(user_id, herb_ids, k, exclude_log_id=None):
+    # 在数据库中按LSH桶取出当前用户的候选日志（最近的优先），再计算精确的Jaccard相似度；
+    # 索引保存在数据库中，各工作进程共享，不占用进程内存
+    herbs = frozenset(herb_ids)
+    if not herbs:
+        return []
+    config = current_app.config
+    buckets = get_hasher(config['SIMILAR_NUM_PERM']).band_keys([sorted(herbs)], config['SIMILAR_BANDS'])[0]
+    query = db.session.query(HerbSetBand.log_id) \
+        .filter(HerbSetBand.user_id == user_id, HerbSetBand.bucket.in_(buckets.tolist()))
+    if exclude_log_id is not None:
+        query = query.filter(HerbSetBand.log_id != exclude_log_id)
+    log_ids = [log_id for log_id, in query.distinct()
+               .order_by(HerbSetBand.log_id.desc()).limit(config['SIMILAR_MAX_CANDIDATES'])]
+    if not log_ids:
+        return []
+    # 相同的中药组合只返回最近的一条
+    latest = {}
+    for log_id, key in db.session.query(DiagnosisLog.id, DiagnosisLog.herb_ids).filter(DiagnosisLog.id.in_(log_ids)):
+        if key and latest.get(key, 0) < log_id:
+            latest[key] = log_id
+    scored = []
+    for key, log_id in latest.items():
+        other = frozenset(_parse_herb_ids(key))
+        scored.append((len(herbs & other) / len(herbs | other), log_id))
+    return heapq.nlargest(k, scored)
+
+
+def rebuild_similarity_index(chunk_size=REBUILD_CHUNK_SIZE):
+    # 离线命令：清空后根据全部诊断日志重建，期间新写入的日志可能重复或遗漏，应在停止服务时执行
+    backfilled = backfill_herb_ids(chunk_size)
+    HerbSetBand.query.delete()
+    indexed = 0
+    last_id = 0
+    while True:
+        logs = db.session.query(DiagnosisLog.id, DiagnosisLog.user_id, DiagnosisLog.herb_ids) \
+            .filter(DiagnosisLog.id > last_id) \
+            .order_by(DiagnosisLog.id).limit(chunk_size).all()
+        if not logs:
+            break
+        insert_bands((log_id, user_id, _parse_herb_ids(herb_ids)) for log_id, user_id, herb_ids in logs)
+        db.session.commit()
+        indexed += len(logs)
+        last_id = logs[-1][0]
+    db.session.commit()
+    return {'backfilled_logs': backfilled, 'indexed_logs': indexed}
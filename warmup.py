@@ -0,0 +1,20 @@
+import logging
+import time
+from model_registry import registry, get_kb_version
+from herb_lexicon import lexicons
+from herb_suggest import herb_suggestions
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(app):
+    # 在工作进程接收请求前加载jieba词典、中药词典、中药名提示索引和诊断模型
+    started = time.perf_counter()
+    with app.app_context():
+        version = get_kb_version()
+        lexicons.get_lexicon(version)
+        herb_suggestions.get_suggester(version)
+        registry.get_model(version=version)
+    elapsed = time.perf_counter() - started
+    logger.info('预热完成，知识库版本 %s，耗时 %.2f 秒', version, elapsed)
+    return elapsed